@@ -0,0 +1,186 @@
+from evaluator import evaluate_batch
+import numpy as np
+
+# Many independent tables played in lockstep, with the state of every table
+# held in arrays (one row per table, one column per seat) instead of Player
+# objects, so dealing, betting and the showdown each run once for all tables.
+# Each hand follows Table.play_hand: rotate the seats, deal two cards each and
+# the five board cards, take_bets, get_matches and give_money_to_winner.
+
+class BatchPolicy:
+    """ How one seat plays at every table at once: the batched counterpart of a Player.
+
+    Both hooks are given the BatchTable, the seat and the (num_tables,) array of
+    highest bets so far, and return a (num_tables,) bool array of whether the seat
+    bets (or matches) and a (num_tables,) float array of the amounts.  Rows of
+    tables where the seat has already folded are ignored.
+    """
+    def place_bets(self, table, seat, highest_bet):
+        raise NotImplementedError
+
+    def matches(self, table, seat, highest_bet):
+        raise NotImplementedError
+
+class AutomaticPolicy(BatchPolicy):
+    """ AutomaticPlayer's rules."""
+    def place_bets(self, table, seat, highest_bet):
+        category = table.categories[:, seat]
+        money = table.money[:, seat]
+        amount = np.where(category > 4, money, np.where(category > 2, money / 3, 0.0))
+        return amount >= highest_bet, amount
+
+    def matches(self, table, seat, highest_bet):
+        recent_bet = table.recent_bet[:, seat]
+        difference = highest_bet - recent_bet
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction_of_prev_bet = np.where(recent_bet == 0, np.inf, difference / recent_bet)
+        match = (difference < table.money[:, seat]) & (table.categories[:, seat] > 2) & (fraction_of_prev_bet < 0.5)
+        level = recent_bet == highest_bet
+        return level | match, np.where(level, 0.0, difference)
+
+class RandomPolicy(BatchPolicy):
+    """ RandomPlayer's rules, drawing from the table's generator."""
+    def place_bets(self, table, seat, highest_bet):
+        amount = table.rng.random(table.num_tables) * (table.money[:, seat] / 2)
+        return amount >= highest_bet, amount
+
+    def matches(self, table, seat, highest_bet):
+        recent_bet = table.recent_bet[:, seat]
+        difference = highest_bet - recent_bet
+        coin = table.rng.random(table.num_tables)
+        match = (difference < table.money[:, seat]) & (recent_bet > 0.1 * highest_bet) & (coin > 0.1)
+        level = recent_bet == highest_bet
+        return level | match, np.where(level, 0.0, difference)
+
+class BatchTable:
+    """ num_tables independent tables of the same seats, played in lockstep without printing.
+
+    Args:
+        policies: one BatchPolicy per seat
+        num_tables: number of tables
+        initial_money: every seat's starting money
+        seed: seed for dealing and for the policies' random choices
+    """
+    def __init__(self, policies: list[BatchPolicy], num_tables: int, initial_money=100, seed=None):
+        self.policies = policies
+        self.num_tables = num_tables
+        self.num_players = len(policies)
+        self.rng = np.random.default_rng(seed)
+        self.money = np.full((num_tables, self.num_players), initial_money, dtype=np.float64)
+        self.pot = np.zeros(num_tables)
+        self.recent_bet = np.zeros((num_tables, self.num_players))
+        self.active = np.ones((num_tables, self.num_players), dtype=bool)
+        self.hole_cards = np.zeros((num_tables, self.num_players, 2), dtype=np.int8)
+        self.board = np.zeros((num_tables, 5), dtype=np.int8)
+        self.strengths = np.zeros((num_tables, self.num_players), dtype=np.int32)
+        self.categories = np.zeros((num_tables, self.num_players), dtype=np.int8)
+        self.order = list(range(self.num_players)) # the seats in betting order, as Table.rotation_order
+        self.hands_played = 0
+
+    def rotate_players(self):
+        self.order.append(self.order.pop(0))
+
+    def deal(self, hole_cards=None, board=None):
+        """ Deal every table, from shuffled decks unless the cards (as ids, by seat) are given."""
+        if hole_cards is None:
+            decks = self.rng.permuted(np.tile(np.arange(52, dtype=np.int8), (self.num_tables, 1)), axis=1)
+            dealt = decks[:, :2 * self.num_players]
+            # two cards each in betting order, as Table.new_hand_deal, then the board
+            self.hole_cards[:, self.order] = dealt.reshape(self.num_tables, self.num_players, 2)
+            self.board[:] = decks[:, 2 * self.num_players:2 * self.num_players + 5]
+        else:
+            self.hole_cards[:] = hole_cards
+            self.board[:] = board
+        hands = np.concatenate([np.repeat(self.board[:, None], self.num_players, axis=1), self.hole_cards], axis=2)
+        strengths, categories = evaluate_batch(hands.reshape(-1, 7))
+        self.strengths[:] = strengths.reshape(self.num_tables, self.num_players)
+        self.categories[:] = categories.reshape(self.num_tables, self.num_players)
+        self.active[:] = True
+
+    def take_bets(self):
+        highest_bet = np.zeros(self.num_tables)
+        for seat in self.order:
+            bet, amount = self.policies[seat].place_bets(self, seat, highest_bet)
+            bet &= self.active[:, seat]
+            amount = np.where(bet, amount, 0.0)
+            self.money[:, seat] -= amount
+            self.pot += amount
+            self.recent_bet[:, seat] = amount
+            np.maximum(highest_bet, amount, out=highest_bet)
+            self.active[:, seat] = bet
+        return highest_bet
+
+    def get_matches(self, highest_bet):
+        for seat in self.order:
+            match, amount = self.policies[seat].matches(self, seat, highest_bet)
+            match &= self.active[:, seat]
+            amount = np.where(match, amount, 0.0)
+            self.money[:, seat] -= amount
+            self.pot += amount
+            self.active[:, seat] = match
+
+    def give_money_to_winner(self):
+        strengths = np.where(self.active, self.strengths, 0)
+        hand_winners = strengths == strengths.max(axis=1, keepdims=True)
+        pot_split = self.pot / hand_winners.sum(axis=1)
+        self.money += np.where(hand_winners, pot_split[:, None], 0.0)
+        self.pot[:] = 0
+        return hand_winners
+
+    def play_hand(self, hole_cards=None, board=None):
+        """ One hand at every table; returns the (num_tables, num_players) mask of winners."""
+        assert (self.money >= 0).all()
+        self.rotate_players()
+        self.deal(hole_cards, board)
+        highest_bet = self.take_bets()
+        self.get_matches(highest_bet)
+        self.hands_played += 1
+        return self.give_money_to_winner()
+
+    def play(self, num_hands):
+        for _ in range(num_hands):
+            self.play_hand()
+        return self.money
+
+
+def test_matches_table():
+    from table import Table
+    from player import AutomaticPlayer
+    num_tables, num_players, num_hands = 20, 4, 15
+    tables = [Table([AutomaticPlayer(f"Bot {i}", 100) for i in range(num_players)], seed=seed) for seed in range(num_tables)]
+    batch = BatchTable([AutomaticPolicy() for _ in range(num_players)], num_tables)
+    for _ in range(num_hands):
+        for table in tables:
+            table.new_hand_deal()
+            table.deal_table_cards()
+        seats = [list(table.players_dict.values()) for table in tables]
+        batch.play_hand(np.array([[[card.id for card in player.cards] for player in players] for players in seats]),
+                        np.array([[card.id for card in table.face_up_cards] for table in tables]))
+        for table in tables:
+            table.take_bets()
+            table.get_matches()
+            table.give_money_to_winner()
+        expected = np.array([[player.money for player in players] for players in seats])
+        assert np.allclose(batch.money, expected)
+    assert not np.allclose(batch.money, 100) # some money changed hands
+
+def test_random_tables():
+    batch = BatchTable([RandomPolicy(), RandomPolicy(), AutomaticPolicy()], 1000, seed=0)
+    dealt = []
+    for _ in range(5):
+        batch.play_hand()
+        dealt.append(np.concatenate([batch.hole_cards.reshape(1000, -1), batch.board], axis=1))
+        assert (np.sort(dealt[-1], axis=1)[:, 1:] != np.sort(dealt[-1], axis=1)[:, :-1]).all()
+    assert np.allclose(batch.money.sum(axis=1), 300) and (batch.money >= 0).all()
+    again = BatchTable([RandomPolicy(), RandomPolicy(), AutomaticPolicy()], 1000, seed=0)
+    assert (again.play(5) == batch.money).all()
+
+if __name__ == "__main__":
+    import time
+    test_matches_table()
+    test_random_tables()
+    batch = BatchTable([RandomPolicy(), RandomPolicy(), RandomPolicy(), AutomaticPolicy()], 100_000, seed=0)
+    start = time.perf_counter()
+    batch.play(10)
+    elapsed = time.perf_counter() - start
+    print(f"{batch.num_tables * batch.hands_played / elapsed:,.0f} hands per second")
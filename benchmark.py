@@ -0,0 +1,140 @@
+""" Throughput and latency of hand evaluation and showdown, per hand category.
+
+    python benchmark.py                    # run, write benchmark_results.json and compare to the baseline
+    python benchmark.py --save-baseline    # run and store the results as the new baseline
+
+Exits with status 1 if anything is slower than the baseline by more than
+the threshold.  Baselines are machine specific, so store one on the machine
+that runs the comparison.
+"""
+from cards import Pack
+from evaluator import evaluation, beats, equals, winners, hand_strength, best_strength, evaluate_batch
+from canonical import cached_evaluation, evaluation_cache
+from player import Player
+from generator import (generate_high_card, generate_pair, generate_two_pair, generate_three_of_a_kind, generate_straight,
+                       generate_flush, generate_full_house, generate_four_of_a_kind, generate_straight_flush,
+                       generate_royal_flush)
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import numpy as np
+
+generators = {
+    'high card': generate_high_card,
+    'pair': generate_pair,
+    'two pair': generate_two_pair,
+    'three of a kind': generate_three_of_a_kind,
+    'straight': generate_straight,
+    'flush': generate_flush,
+    'full house': generate_full_house,
+    'four of a kind': generate_four_of_a_kind,
+    'straight flush': generate_straight_flush,
+    'royal flush': generate_royal_flush,
+}
+
+def seven_cards(hand):
+    """ The 5-card hand as a board plus two other cards as hole cards."""
+    pack = Pack()
+    pack.shuffle()
+    return hand, [card for card in pack.cards if card not in hand][:2]
+
+def time_calls(function, inputs, batch=1):
+    """ Time function(input) for each input.
+
+    Returns:
+        dict of operations per second and the median and 99th percentile
+        latency of a call in microseconds; batch is the number of hands per call
+    """
+    timings = []
+    clock = time.perf_counter_ns
+    for argument in inputs:
+        start = clock()
+        function(argument)
+        timings.append(clock() - start)
+    timings.sort()
+    return {
+        'ops_per_sec': batch * len(timings) / (sum(timings) / 1e9),
+        'p50_us': timings[len(timings) // 2] / 1e3,
+        'p99_us': timings[int(len(timings) * 0.99)] / 1e3,
+    }
+
+def run(num_hands=2000, seed=0):
+    random.seed(seed)
+    results = {}
+    player = Player('benchmark', 0)
+    for category, generate in generators.items():
+        hands = [generate() for _ in range(num_hands)]
+        others = [generate_pair() for _ in range(num_hands)]
+        sevens = [seven_cards(hand) for hand in hands]
+        # a showdown between this category and pairs; keep only pairs of hands without shared cards
+        showdowns = [(hand, other) for hand, other in zip(hands, others) if not set(hand) & set(other)]
+        unequal = [pair for pair in showdowns if not equals(*pair)]
+
+        def get_best_hand(board_and_hole):
+            player.cards = board_and_hole[1]
+            return player.get_best_hand(board_and_hole[0])
+
+        cases = {
+            'evaluation': (evaluation, hands),
+            'beats': (lambda pair: beats(*pair), unequal),
+            'equals': (lambda pair: equals(*pair), showdowns),
+            'winners': (winners, [list(pair) for pair in showdowns]),
+            'get_best_hand': (get_best_hand, sevens),
+            'hand_strength': (hand_strength, hands),
+            'best_strength': (best_strength, [[card.id for card in board + hole] for board, hole in sevens]),
+            'cached_evaluation': (cached_evaluation, hands),
+        }
+        for name, (function, inputs) in cases.items():
+            results[f'{name}/{category}'] = time_calls(function, inputs)
+
+        ids = np.array([[card.id for card in board + hole] for board, hole in sevens])
+        results[f'evaluate_batch_5/{category}'] = time_calls(evaluate_batch, [ids[:, :5]] * 5, batch=len(ids))
+        results[f'evaluate_batch_7/{category}'] = time_calls(evaluate_batch, [ids] * 5, batch=len(ids))
+        evaluation_cache.clear()
+    return results
+
+def compare(results, baseline, threshold):
+    """ The benchmarks whose throughput fell more than threshold below the baseline."""
+    regressions = []
+    for name, previous in baseline.items():
+        if name in results and results[name]['ops_per_sec'] < (1 - threshold) * previous['ops_per_sec']:
+            regressions.append((name, previous['ops_per_sec'], results[name]['ops_per_sec']))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hands', type=int, default=2000, help='hands per category')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default='benchmark_baseline.json')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed fractional slowdown')
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args(argv)
+
+    results = run(args.hands)
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+    for name, result in results.items():
+        print(f"{name:40} {result['ops_per_sec']:14,.0f}/s  p50 {result['p50_us']:8.2f}us  p99 {result['p99_us']:8.2f}us")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=1)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to store one")
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for name, before, after in regressions:
+        print(f"REGRESSION {name}: {before:,.0f}/s -> {after:,.0f}/s")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
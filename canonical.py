@@ -0,0 +1,158 @@
+from cards import Card, Pack, cards_by_id
+from evaluator import evaluation, best_strength, hand_for_strength
+from collections import OrderedDict
+from itertools import combinations
+
+# Hands that differ only by a relabelling of the suits play identically, so
+# they can share one canonical form.  Each suit is described by the ranks it
+# holds in each group of cards (e.g. hole cards, then board), and the suits
+# are renumbered in order of those descriptions, highest first.
+
+rank_names = '23456789TJQKA'
+
+def _suit_keys(groups):
+    keys = [[0] * len(groups) for _ in range(4)]
+    for group_index, group in enumerate(groups):
+        for card in group:
+            keys[card.suit_index][group_index] |= card.rank_bit
+    return [tuple(key) for key in keys]
+
+def canonical_key(*groups: list[Card]) -> tuple:
+    """ A hashable key equal for exactly the suit-isomorphic versions of these groups of cards."""
+    return tuple(sorted(_suit_keys(groups), reverse=True))
+
+def canonical_cards(*groups: list[Card]) -> tuple[list[Card], ...]:
+    """ The canonical representative of these groups of cards.
+
+    Suits are renumbered hearts, diamonds, clubs, spades in order of the
+    canonical key, and each group comes back sorted by id.
+    """
+    keys = _suit_keys(groups)
+    order = sorted(range(4), key=lambda suit: keys[suit], reverse=True)
+    new_suit = {suit: new for new, suit in enumerate(order)}
+    return tuple(sorted((cards_by_id[card.rank * 4 + new_suit[card.suit_index]] for card in group),
+                        key=lambda card: card.id)
+                 for group in groups)
+
+def starting_hand_name(cards: list[Card]) -> str:
+    """ The name of one of the 169 canonical hole-card pairs, e.g. 'AKs', 'T9o' or '77'."""
+    high, low = sorted(cards, key=lambda card: card.rank, reverse=True)
+    name = rank_names[high.rank] + rank_names[low.rank]
+    if high.rank == low.rank:
+        return name
+    return name + ('s' if high.suit_index == low.suit_index else 'o')
+
+# all 169, pairs then suited then offsuit, each from the top down
+starting_hands = ([rank_names[rank] * 2 for rank in range(12, -1, -1)]
+                  + [rank_names[high] + rank_names[low] + 's' for high in range(12, -1, -1) for low in range(high - 1, -1, -1)]
+                  + [rank_names[high] + rank_names[low] + 'o' for high in range(12, -1, -1) for low in range(high - 1, -1, -1)])
+starting_hand_index = {name: index for index, name in enumerate(starting_hands)}
+
+def starting_hand_cards(name: str) -> list[Card]:
+    """ A pair of hole cards with this starting hand name."""
+    high, low = rank_names.index(name[0]) + 2, rank_names.index(name[1]) + 2
+    if high == low or name[2] == 'o':
+        return [Card('hearts', high), Card('diamonds', low)]
+    return [Card('hearts', high), Card('hearts', low)]
+
+class CanonicalCache:
+    """ A size-bounded, least-recently-used memo of results keyed by canonical form.
+
+    Only use it for results that do not depend on the suits' names, such as
+    hand strengths or equities.
+    """
+    def __init__(self, maxsize=1 << 16):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, compute, keep=None):
+        """ The result stored for key, calling compute() to fill it on a miss.
+
+        A computed result is only stored if keep is None or keep(result) is true.
+        """
+        try:
+            result = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            result = compute()
+            if keep is not None and not keep(result):
+                return result
+            self.entries[key] = result
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            return result
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return result
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self.entries), 'maxsize': self.maxsize}
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+evaluation_cache = CanonicalCache()
+best_hand_cache = CanonicalCache()
+
+def cached_evaluation(cards: list[Card]):
+    """ evaluation(cards), computed once per canonical 5-card hand."""
+    return list(evaluation_cache.get(canonical_key(cards), lambda: tuple(evaluation(cards))))
+
+def cached_best_hand(table_cards: list[Card], hole_cards: list[Card]) -> tuple[int, list[Card]]:
+    """ The same as best_hand(table_cards + hole_cards), with the strength
+    computed once per canonical board and hole cards.
+    """
+    cards = table_cards + hole_cards
+    strength = best_hand_cache.get(canonical_key(hole_cards, table_cards),
+                                   lambda: best_strength([card.id for card in cards]))
+    return strength, hand_for_strength(strength, cards)
+
+
+def test_canonical_key_ignores_suit_names():
+    hand = [Card('hearts', 14), Card('hearts', 13), Card('clubs', 2), Card('spades', 2), Card('spades', 9)]
+    relabelled = [Card('diamonds', 14), Card('diamonds', 13), Card('hearts', 2), Card('clubs', 2), Card('clubs', 9)]
+    assert canonical_key(hand) == canonical_key(relabelled)
+    assert canonical_cards(hand) == canonical_cards(relabelled)
+    assert canonical_key(hand) != canonical_key(hand[:4] + [Card('hearts', 9)])
+    # which group a card is in matters
+    assert canonical_key(hand[:2], hand[2:]) != canonical_key(hand[2:4], hand[:2] + hand[4:])
+
+def test_class_counts():
+    pack = Pack()
+    assert len({canonical_key(list(hand)) for hand in combinations(pack.cards, 2)}) == 169
+    assert {starting_hand_name(list(hand)) for hand in combinations(pack.cards, 2)} == set(starting_hands)
+    assert len(starting_hands) == 169
+    assert all(starting_hand_name(starting_hand_cards(name)) == name for name in starting_hands)
+
+def test_cache():
+    cache = CanonicalCache(maxsize=2)
+    hand = [Card('hearts', value) for value in [2, 3, 4, 5, 7]]
+    assert cached_evaluation(hand) == evaluation(hand)
+    assert cache.get(1, lambda: 'a') == 'a'
+    assert cache.get(1, lambda: 'b') == 'a'
+    cache.get(2, lambda: 'c')
+    cache.get(3, lambda: 'd')
+    assert cache.stats() == {'hits': 1, 'misses': 3, 'evictions': 1, 'size': 2, 'maxsize': 2}
+    assert 1 not in cache.entries
+
+def test_cached_best_hand():
+    pack = Pack()
+    for _ in range(200):
+        pack.shuffle()
+        strength, hand = cached_best_hand(pack.cards[2:7], pack.cards[:2])
+        assert strength == best_strength([card.id for card in pack.cards[:7]])
+        assert all(card in pack.cards[:7] for card in hand)
+
+if __name__ == "__main__":
+    test_canonical_key_ignores_suit_names()
+    test_class_counts()
+    test_cache()
+    test_cached_best_hand()
+    num_hands = len({canonical_key(list(hand)) for hand in combinations(Pack().cards, 5)})
+    print(f"{num_hands} canonical 5-card hands")
@@ -1,16 +1,54 @@
+from numbers import Integral
 import random
 suits = ['hearts', 'diamonds', 'clubs', 'spades']
+suit_index = {suit: index for index, suit in enumerate(suits)}
+
+# A card's id is 4 * (value - 2) + suit index, so ids 0..51 run in the same
+# order Pack has always dealt them: 2H, 2D, 2C, 2S, 3H, ... , AS.
+def card_id(suit, value):
+    return 4 * (value - 2) + suit_index[suit]
+
 class Card:
-    def __init__(self, suit, value):
-        assert suit in suits, "invalid suit"
-        assert value in [i for i in range(2, 15)], "invalid value"
-        self.suit = suit
-        self.value = value
+    """ A playing card.
+
+    There are only 52 Card objects: Card(suit, value) hands back the shared
+    instance for that card, so cards can be compared by identity or by id.
+    """
+    __slots__ = ('id', 'suit', 'value', 'rank', 'suit_index', 'rank_bit', 'bit')
+
+    def __new__(cls, suit, value):
+        assert suit in suit_index, "invalid suit"
+        assert value in _values, "invalid value"
+        return cards_by_id[card_id(suit, value)]
+
+    @classmethod
+    def _make(cls, id):
+        card = object.__new__(cls)
+        card.id = id
+        card.rank = id >> 2 # 0 for a two up to 12 for an ace
+        card.value = card.rank + 2
+        card.suit_index = id & 3
+        card.suit = suits[card.suit_index]
+        card.rank_bit = 1 << card.rank
+        card.bit = 1 << id
+        return card
 
+    def __reduce__(self):
+        # unpickle to the shared instance rather than a copy
+        return card_from_id, (self.id,)
+
+    def __eq__(self, other):
+        return isinstance(other, Card) and self.id == other.id
+
+    def __hash__(self):
+        return self.id
 
     def __lt__(self, other):
         return self.value < other.value
 
+    def __repr__(self):
+        return f"Card({self.suit!r}, {self.value})"
+
     def __str__(self):
         names = {14:'A', 11:'J', 12:'Q', 13:'K'}
         if self.value in names:
@@ -18,26 +56,116 @@ class Card:
         else:
             return str(self.value) + self.suit[0].upper()
 
+_values = frozenset(range(2, 15))
+cards_by_id = tuple(Card._make(id) for id in range(52))
+
+def card_from_id(id):
+    return cards_by_id[id]
+
+def card_ids(cards):
+    return [card.id for card in cards]
+
 class Pack:
+    """ The 52 cards, shuffled and dealt as ids; Card objects are only looked up for callers that want them."""
     def __init__(self):
-        self.cards = []
-        for value in range(2,15):
-            for suit in ['hearts', 'diamonds', 'clubs', 'spades']:
-                self.cards.append(Card(suit, value))
+        self.ids = list(range(52))
+
+    @property
+    def cards(self):
+        return [cards_by_id[id] for id in self.ids]
 
     def shuffle(self):
-        random.shuffle(self.cards)
+        random.shuffle(self.ids)
 
     def print_deck(self):
-        for card in self.cards:
-            print(card)
+        for id in self.ids:
+            print(cards_by_id[id])
+
+    def deal_id(self):
+        return self.ids.pop(0)
 
     def top_card(self):
-        return self.cards.pop(0)
+        return cards_by_id[self.deal_id()]
+
+    def card_ids(self):
+        return list(self.ids)
+
+class Deck:
+    """ A reusable pack of card ids with its own random number generator.
+
+    Shuffling reorders one list in place and dealing moves an index along
+    it, so a hand costs no allocation.  Decks built with the same seed and
+    stream deal the same cards; different streams are independent.
+    """
+    def __init__(self, seed=None, stream=0, dead=()):
+        self.rng = random.Random(None if seed is None else f"{seed}/{stream}")
+        self.ids = list(range(52))
+        self.position = 0
+        if dead:
+            self.remove(dead)
+
+    def remove(self, cards):
+        """ Take these cards (or ids) out of the deck, for dealing around known cards."""
+        dead = {int(card) if isinstance(card, Integral) else card.id for card in cards}
+        self.ids = [id for id in self.ids if id not in dead]
+        self.position = 0
+
+    def restore(self):
+        """ Put any removed cards back."""
+        self.ids = list(range(52))
+        self.position = 0
+
+    def shuffle(self):
+        self.rng.shuffle(self.ids)
+        self.position = 0
+
+    def deal_id(self):
+        id = self.ids[self.position]
+        self.position += 1
+        return id
+
+    def top_card(self):
+        return cards_by_id[self.deal_id()]
+
+    def remaining(self):
+        return len(self.ids) - self.position
+
+    def print_deck(self):
+        for id in self.ids[self.position:]:
+            print(cards_by_id[id])
+
+
+def test_pack_deals_ids():
+    pack = Pack()
+    assert pack.card_ids() == list(range(52)) and pack.cards == list(cards_by_id)
+    random.seed(3)
+    pack.shuffle()
+    ids = pack.card_ids()
+    assert pack.deal_id() == ids[0] and pack.top_card() is cards_by_id[ids[1]]
+    assert pack.card_ids() == ids[2:] and sorted(ids) == list(range(52))
+
+def test_deck_streams():
+    first, same, other = [], [], []
+    for deck, dealt in zip([Deck(7, 0), Deck(7, 0), Deck(7, 1)], [first, same, other]):
+        deck.shuffle()
+        dealt.extend(deck.deal_id() for _ in range(52))
+    assert first == same != other
+    assert sorted(first) == list(range(52))
+
+def test_deck_dead_cards():
+    deck = Deck(seed=1, dead=[Card('hearts', 14), 0])
+    deck.shuffle()
+    dealt = [deck.deal_id() for _ in range(deck.remaining())]
+    assert len(dealt) == 50 and Card('hearts', 14).id not in dealt and 0 not in dealt
+    deck.restore()
+    assert deck.remaining() == 52
+    import numpy as np
+    deck.remove(np.array([3, 51], dtype=np.int8)) # ids as the batch generators hand them out
+    assert deck.remaining() == 50 and 3 not in deck.ids and 51 not in deck.ids
 
 if __name__ == "__main__":
     pack = Pack()
     pack.print_deck()
 
     pack.shuffle()
-    pack.print_deck()
\ No newline at end of file
+    pack.print_deck()
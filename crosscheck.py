@@ -0,0 +1,132 @@
+""" Check that the fast evaluators rank hands exactly like reference_evaluation.
+
+    python crosscheck.py                   # all 2,598,960 5-card hands and 1,000,000 random 7-card hands
+    python crosscheck.py --sevens 100000 --processes 8
+
+Every backend must give hands with the same reference score the same
+strength, and order the scores the same way.  Mismatches are printed with
+the cards involved and the exit status is 1.
+"""
+from cards import cards_by_id
+from evaluator import reference_evaluation, evaluation, hand_strength, best_strength, best_hand, evaluate_batch
+import rank_table
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+def _record(seen, conflicts, score, strength, hand_ids):
+    """ Remember the strength a backend gave this score, noting a conflict if it differs."""
+    previous = seen.setdefault(score, (strength, hand_ids))
+    if previous[0] != strength and len(conflicts) < 20:
+        conflicts.append((score, previous, (strength, hand_ids)))
+
+def _check_backends(hands, reference_scores, backends):
+    seen = {name: {} for name in backends}
+    conflicts = {name: [] for name in backends}
+    for name, strengths in backends.items():
+        for hand_ids, score, strength in zip(hands, reference_scores, strengths):
+            _record(seen[name], conflicts[name], score, strength, hand_ids)
+    return seen, conflicts
+
+def _five_card_shard(lowest_id, table_path):
+    """ Every 5-card hand whose lowest card id is lowest_id."""
+    hands = [(lowest_id,) + rest for rest in combinations(range(lowest_id + 1, 52), 4)]
+    cards = [[cards_by_id[id] for id in hand] for hand in hands]
+    reference_scores = [tuple(reference_evaluation(hand)) for hand in cards]
+    ids = np.array(hands)
+    backends = {
+        'evaluation': [tuple(evaluation(hand)) for hand in cards],
+        'hand_strength': [hand_strength(hand) for hand in cards],
+        'best_strength': [best_strength(hand) for hand in hands],
+        'evaluate_batch': evaluate_batch(ids)[0].tolist(),
+    }
+    if table_path is not None:
+        backends['rank_table'] = rank_table.load(table_path).lookup(ids).tolist()
+    return _check_backends(hands, reference_scores, backends)
+
+def _seven_card_shard(num_hands, seed):
+    """ num_hands random 7-card hands, scored by their best reference 5-card score."""
+    rng = np.random.default_rng(seed)
+    ids = np.argsort(rng.random((num_hands, 52)), axis=1)[:, :7]
+    hands = [tuple(hand) for hand in ids.tolist()]
+    reference_scores = [max(tuple(reference_evaluation([cards_by_id[id] for id in five])) for five in combinations(hand, 5))
+                        for hand in hands]
+    backends = {
+        'best_strength': [best_strength(hand) for hand in hands],
+        'best_hand': [],
+        'evaluate_batch_7': evaluate_batch(ids)[0].tolist(),
+    }
+    for hand in hands:
+        strength, five = best_hand([cards_by_id[id] for id in hand])
+        # the five cards must really be that strong
+        backends['best_hand'].append(strength if hand_strength(five) == strength else -1)
+    return _check_backends(hands, reference_scores, backends)
+
+def _merge(total_seen, total_conflicts, shard):
+    seen, conflicts = shard
+    for name in seen:
+        backend_seen = total_seen.setdefault(name, {})
+        backend_conflicts = total_conflicts.setdefault(name, [])
+        backend_conflicts.extend(conflicts[name])
+        for score, (strength, hand_ids) in seen[name].items():
+            _record(backend_seen, backend_conflicts, score, strength, hand_ids)
+
+def _order_errors(seen):
+    """ Neighbouring reference scores whose strengths are not strictly increasing."""
+    scores = sorted(seen)
+    return [(lower, seen[lower], higher, seen[higher]) for lower, higher in zip(scores, scores[1:])
+            if not seen[lower][0] < seen[higher][0]]
+
+def _describe(hand_ids):
+    return ' '.join(str(cards_by_id[id]) for id in hand_ids)
+
+def report(seen, conflicts):
+    """ Print the problems for each backend and return how many there were."""
+    problems = 0
+    for name in seen:
+        order_errors = _order_errors(seen[name])
+        problems += len(conflicts[name]) + len(order_errors)
+        print(f"{name}: {len(seen[name])} reference scores, {len(conflicts[name])} conflicts, {len(order_errors)} ordering errors")
+        for score, (strength1, hand1), (strength2, hand2) in conflicts[name][:20]:
+            print(f"  score {list(score)}: {_describe(hand1)} -> {strength1} but {_describe(hand2)} -> {strength2}")
+        for lower, (strength1, hand1), higher, (strength2, hand2) in order_errors[:20]:
+            print(f"  {_describe(hand1)} {list(lower)} -> {strength1} is not below {_describe(hand2)} {list(higher)} -> {strength2}")
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--sevens', type=int, default=1_000_000, help='number of random 7-card hands')
+    parser.add_argument('--shard-size', type=int, default=20_000, help='7-card hands per shard')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-fives', action='store_true')
+    parser.add_argument('--rank-table', default=rank_table.default_path, help='checked too if the file exists')
+    args = parser.parse_args(argv)
+
+    table_path = args.rank_table if os.path.exists(args.rank_table) else None
+    start = time.perf_counter()
+    problems = 0
+    with ProcessPoolExecutor(args.processes) as pool:
+        if not args.skip_fives:
+            seen, conflicts = {}, {}
+            # biggest shards first so the pool stays busy to the end
+            for shard in pool.map(_five_card_shard, range(48), [table_path] * 48):
+                _merge(seen, conflicts, shard)
+            print(f"5-card hands, {time.perf_counter() - start:.0f}s")
+            problems += report(seen, conflicts)
+
+        sizes = [args.shard_size] * (args.sevens // args.shard_size) + [args.sevens % args.shard_size] * bool(args.sevens % args.shard_size)
+        seeds = np.random.SeedSequence(args.seed).spawn(len(sizes))
+        seen, conflicts = {}, {}
+        for shard in pool.map(_seven_card_shard, sizes, seeds):
+            _merge(seen, conflicts, shard)
+        print(f"7-card hands, {time.perf_counter() - start:.0f}s")
+        problems += report(seen, conflicts)
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
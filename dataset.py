@@ -0,0 +1,103 @@
+from generator import batch_generators
+from evaluator import evaluate_batch
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import numpy as np
+
+# A hand-category dataset kept on disk as .npy shards:
+#   manifest.json          - format version, row and shard counts, seed
+#   shard_00000_X.npy, ... - int8 features, (rows, 10)
+#   shard_00000_y.npy, ... - int8 category labels, (rows,)
+# Shards are written by worker processes straight into memory-mapped files
+# and read back memory-mapped, so neither building nor training ever holds
+# more than a shard or so in memory.
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+
+def features(ids):
+    # (value, suit) for each card, the layout environment.get_state uses
+    return np.stack([ids // 4 + 2, ids % 4], axis=-1).reshape(len(ids), -1)
+
+def _write_shard(directory, shard, num_datapoints, seed_sequence):
+    """ Generate one shard of num_datapoints, each one hand of every category, and write it."""
+    rng = np.random.default_rng(seed_sequence)
+    hand_ids = np.stack([generate_batch(num_datapoints, rng) for _, generate_batch in batch_generators.values()], axis=1)
+    hand_ids = hand_ids.reshape(-1, 5)
+    names = {'X': f'shard_{shard:05d}_X.npy', 'y': f'shard_{shard:05d}_y.npy'}
+    X = np.lib.format.open_memmap(os.path.join(directory, names['X']), mode='w+', dtype=np.int8, shape=(len(hand_ids), 10))
+    y = np.lib.format.open_memmap(os.path.join(directory, names['y']), mode='w+', dtype=np.int8, shape=(len(hand_ids),))
+    X[:] = features(hand_ids)
+    y[:] = evaluate_batch(hand_ids)[1]
+    X.flush()
+    y.flush()
+    return dict(names, rows=len(hand_ids))
+
+def build(directory, num_datapoints, datapoints_per_shard=50_000, processes=None, seed=0):
+    """ Write a dataset of num_datapoints (10 hands each) to directory, one shard per worker task."""
+    os.makedirs(directory, exist_ok=True)
+    sizes = [datapoints_per_shard] * (num_datapoints // datapoints_per_shard)
+    if num_datapoints % datapoints_per_shard:
+        sizes.append(num_datapoints % datapoints_per_shard)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    with ProcessPoolExecutor(processes) as pool:
+        shards = list(pool.map(_write_shard, [directory] * len(sizes), range(len(sizes)), sizes, seeds))
+    manifest = {'version': FORMAT_VERSION, 'rows': sum(shard['rows'] for shard in shards),
+                'num_features': 10, 'seed': seed, 'shards': shards}
+    # the manifest goes last, so a directory with one holds a complete dataset
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return ShardedDataset(directory)
+
+class ShardedDataset:
+    """ A dataset written by build, read lazily one memory-mapped shard at a time."""
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        assert self.manifest['version'] == FORMAT_VERSION, f"{directory} holds a version {self.manifest['version']} dataset"
+
+    def __len__(self):
+        return self.manifest['rows']
+
+    @property
+    def num_shards(self):
+        return len(self.manifest['shards'])
+
+    def shard(self, index):
+        """ The features and labels of one shard, memory-mapped."""
+        shard = self.manifest['shards'][index]
+        return (np.load(os.path.join(self.directory, shard['X']), mmap_mode='r'),
+                np.load(os.path.join(self.directory, shard['y']), mmap_mode='r'))
+
+    def batches(self, batch_size, shards=None, rng=None):
+        """ Yield (X, y) batches from the given shards (all of them by default), shuffled if rng is given."""
+        shards = range(self.num_shards) if shards is None else list(shards)
+        if rng is not None:
+            shards = rng.permutation(shards)
+        for index in shards:
+            X, y = self.shard(index)
+            order = rng.permutation(len(y)) if rng is not None else np.arange(len(y))
+            for start in range(0, len(y), batch_size):
+                rows = np.sort(order[start:start + batch_size])
+                yield np.asarray(X[rows]), np.asarray(y[rows])
+
+
+def test_build_and_read(tmp_path):
+    dataset = build(str(tmp_path), 2500, datapoints_per_shard=1000, processes=2, seed=3)
+    assert len(dataset) == 25000 and dataset.num_shards == 3
+    X, y = dataset.shard(2)
+    assert isinstance(X, np.memmap) and X.shape == (5000, 10)
+    assert list(y[:10]) == list(range(10)) # one hand of each category per datapoint
+    assert (X[:, ::2] >= 2).all() and (X[:, ::2] <= 14).all() and (X[:, 1::2] < 4).all()
+    batches = list(dataset.batches(4096, rng=np.random.default_rng(0)))
+    assert sum(len(y) for _, y in batches) == 25000
+    assert np.bincount(np.concatenate([y for _, y in batches])).tolist() == [2500] * 10
+    again = build(str(tmp_path / 'again'), 2500, datapoints_per_shard=1000, processes=1, seed=3)
+    assert (again.shard(1)[0] == dataset.shard(1)[0]).all()
+
+if __name__ == "__main__":
+    import sys
+    dataset = build(sys.argv[1], int(sys.argv[2]))
+    print(f"Wrote {len(dataset)} rows in {dataset.num_shards} shards to {sys.argv[1]}")
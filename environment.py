@@ -1,18 +1,24 @@
 from table import Table
 from player import RandomPlayer, AutomaticPlayer, RLPlayer
+import instrumentation
 import random
-import matplotlib.pyplot as plt
-import torch
 import copy
 import pickle
 suit_values = {'hearts':0, 'diamonds':1, 'clubs':2, 'spades':3} # should do one hot encoding here
-with open('dqn0.pkl', 'rb') as f:
-    opponent_dqn = pickle.load(f)
+
+_opponent_dqns = {}
+
+def load_opponent_dqn(path='dqn0.pkl'):
+    """ The pickled network the RL opponents play with, loaded on first use."""
+    if path not in _opponent_dqns:
+        with open(path, 'rb') as f:
+            _opponent_dqns[path] = pickle.load(f)
+    return _opponent_dqns[path]
 
 class Environment:
-    def __init__(self, player, num_bots, initial_money, verbose=0, game_length=100):
+    def __init__(self, player, num_bots, initial_money, verbose=0, game_length=100, preflop_feature=False, history=None):
         other_players = [RandomPlayer(f"Bot {i+1}", initial_money) for i in range(num_bots)]
-        # other_players = [RLPlayer(f"Bot {i + 1}", initial_money, opponent_dqn) for i in range(num_bots)]
+        # other_players = [RLPlayer(f"Bot {i + 1}", initial_money, load_opponent_dqn()) for i in range(num_bots)]
         self.players = [player] + other_players
         self.initial_money = initial_money
         random.shuffle(self.players)
@@ -21,20 +27,27 @@ class Environment:
         self.num_hands = None
         self.table = None
         self.game_length = game_length
+        # add the hole cards' preflop equity against num_bots opponents to the state
+        self.preflop_feature = preflop_feature
+        # a hand_history.HandHistoryWriter to record every hand played in
+        self.history = history
 
     def get_state(self):
-        face_up_cards = [item for card in self.table.face_up_cards for item in [card.value, suit_values[card.suit]]]
-        player_cards = [item for card in self.rl_player.cards for item in [card.value, suit_values[card.suit]]]
+        import torch # loaded here rather than at import, so the game runs without it
+        face_up_cards = [item for card in self.table.face_up_cards for item in [card.value, card.suit_index]]
+        player_cards = [item for card in self.rl_player.cards for item in [card.value, card.suit_index]]
         player_money = self.rl_player.money
         state = face_up_cards + player_cards + [player_money]
+        if self.preflop_feature:
+            state.append(self.rl_player.get_preflop_equity(len(self.players) - 1))
         state = [float(num) for num in state]
         return torch.tensor(state)
 
     def reset(self):
-        self.table = Table(self.players, verbose=self.verbose)
-        self.table.new_hand_deal()
         for player in self.players:
             player.money = self.initial_money
+        self.table = Table(self.players, verbose=self.verbose, history=self.history)
+        self.table.new_hand_deal()
         random.shuffle(self.players)
         self.table.deal_table_cards()
         self.num_hands = 1
@@ -54,10 +67,31 @@ class Environment:
         terminated = True if (self.num_hands > self.game_length
                                or self.rl_player.money <= 0
                                or any(player.money > 399 for player in self.table.players_dict.values())) else False
+        if terminated:
+            instrumentation.count('environment.episodes')
 
         return self.get_state(), reward, terminated
 
+instrumentation.register(Environment, {'reset': 'environment.reset', 'step': 'environment.step',
+                                       'get_state': 'environment.get_state'})
+
+
+def test_reset_records_initial_money(tmp_path):
+    from hand_history import HandHistoryWriter, HandHistory
+    path = str(tmp_path / 'hands.bin')
+    rl_player = AutomaticPlayer('Louis', 100)
+    with HandHistoryWriter(path, 4) as history:
+        env = Environment(rl_player, 3, 100, game_length=5, history=history)
+        for _ in range(2):
+            env.reset()
+            for _ in range(5):
+                env.step(True, 10)
+    money = HandHistory(path)['money']
+    assert len(money) == 10 and (money[0] == 100).all() and (money[5] == 100).all()
+    assert not (money[4] == 100).all() # money changed hands during the first episode
+
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
     terminated = False
     total_reward = [0]
     money_per_player = 100
@@ -0,0 +1,287 @@
+from cards import Card, Deck
+from evaluator import evaluate_batch, HandState
+from canonical import CanonicalCache, canonical_key
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import combinations
+from math import comb, prod
+from statistics import NormalDist
+import time
+import numpy as np
+
+def sample_counts(hole_ids, board_ids, num_opponents, num_samples, seed_sequence):
+    """ Deal num_samples random completions and total the results for the hole cards.
+
+    Returns:
+        (wins, ties, losses, equity, equity squared) summed over the samples, where a
+        sample's equity is 1 for a win, 1/k for a k-way tie and 0 for a loss
+    """
+    rng = np.random.default_rng(seed_sequence)
+    deck = np.array(Deck(dead=hole_ids + board_ids).ids, dtype=np.int8)
+    missing = 5 - len(board_ids)
+    draws = rng.permuted(np.tile(deck, (num_samples, 1)), axis=1)[:, :missing + 2 * num_opponents]
+
+    boards = np.concatenate([np.tile(np.array(board_ids, dtype=np.int8), (num_samples, 1)), draws[:, :missing]], axis=1)
+    hero = evaluate_batch(np.concatenate([np.tile(np.array(hole_ids, dtype=np.int8), (num_samples, 1)), boards], axis=1))[0]
+    best_opponent = np.zeros(num_samples, dtype=hero.dtype)
+    num_tied = np.zeros(num_samples, dtype=np.int32)
+    for opponent in range(num_opponents):
+        hole = draws[:, missing + 2 * opponent: missing + 2 * opponent + 2]
+        opponent_strength = evaluate_batch(np.concatenate([hole, boards], axis=1))[0]
+        num_tied += opponent_strength == hero
+        np.maximum(best_opponent, opponent_strength, out=best_opponent)
+
+    wins = hero > best_opponent
+    ties = hero == best_opponent
+    shares = np.where(wins, 1.0, np.where(ties, 1.0 / (num_tied + 1), 0.0))
+    return int(wins.sum()), int(ties.sum()), int(num_samples - wins.sum() - ties.sum()), float(shares.sum()), float((shares ** 2).sum())
+
+def num_completions(hole_cards: list[Card], board: list[Card], num_opponents: int) -> int:
+    """ How many (board completion, opponents' hole cards) deals exact_equity walks."""
+    unknown = 52 - len(hole_cards) - len(board)
+    missing = 5 - len(board)
+    return comb(unknown, missing) * prod(comb(unknown - missing - 2 * i, 2) for i in range(num_opponents))
+
+def exact_equity(hole_cards: list[Card], board: list[Card], num_opponents=1):
+    """ Win/tie/lose probabilities found by walking every board completion and
+    every deal of the opponents' hole cards.
+
+    The known board is folded into a HandState once and each completion adds
+    its cards to a copy, which every pair of cards left in the pack then
+    extends by two; the opponents' deals only compare those strengths.
+    """
+    board = list(board)
+    deck = Deck(dead=hole_cards + board).ids
+    board_state = HandState([card.id for card in board])
+    hole_state = HandState([card.id for card in hole_cards + board])
+    totals = [0, 0, 0, 0.0]
+
+    for completion in combinations(deck, 5 - len(board)):
+        full_board = board_state.copy()
+        hand = hole_state.copy()
+        for id in completion:
+            full_board.add(id)
+            hand.add(id)
+        hero = hand.strength()
+        remaining = [id for id in deck if id not in completion]
+        pairs = list(combinations(remaining, 2))
+        strengths = []
+        for a, b in pairs:
+            opponent = full_board.copy()
+            opponent.add(a)
+            opponent.add(b)
+            strengths.append(opponent.strength())
+
+        if num_opponents == 1:
+            wins = sum(strength < hero for strength in strengths)
+            ties = strengths.count(hero)
+            totals[0] += wins
+            totals[1] += ties
+            totals[2] += len(pairs) - wins - ties
+            totals[3] += wins + ties / 2
+            continue
+
+        pair_masks = [1 << a | 1 << b for a, b in pairs]
+
+        def deal(used, opponents_left, best, num_tied):
+            if opponents_left == 0:
+                if hero > best:
+                    totals[0] += 1
+                    totals[3] += 1
+                elif hero == best:
+                    totals[1] += 1
+                    totals[3] += 1 / (num_tied + 1)
+                else:
+                    totals[2] += 1
+                return
+            for mask, strength in zip(pair_masks, strengths):
+                if not used & mask:
+                    deal(used | mask, opponents_left - 1, max(best, strength), num_tied + (strength == hero))
+
+        deal(0, num_opponents, 0, 0)
+
+    n = totals[0] + totals[1] + totals[2]
+    return {'win': totals[0] / n, 'tie': totals[1] / n, 'lose': totals[2] / n,
+            'equity': totals[3] / n, 'samples': n, 'ci_half_width': 0.0, 'exact': True}
+
+class EquityCalculator:
+    """ Monte Carlo win/tie/lose probabilities for hole cards against random opponents.
+
+    Samples are drawn in batches, each with its own RNG stream spawned from
+    one seed, and spread over a process pool when processes > 0.  Sampling
+    stops once the confidence interval on the equity is narrow enough, the
+    time budget runs out or max_samples is reached.  With processes=0 the
+    same seed always gives the same answer.
+
+    Spots with at most exact_limit possible deals left, typically on the
+    turn and river, are enumerated exactly instead of sampled.
+    """
+    def __init__(self, processes=0, seed=None, batch_size=2000, cache_size=1 << 14, exact_limit=100_000):
+        self.pool = ProcessPoolExecutor(processes) if processes else None
+        self.processes = processes
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.batch_size = batch_size
+        self.cache = CanonicalCache(cache_size) if cache_size else None
+        self.exact_limit = exact_limit
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def equity(self, hole_cards: list[Card], board: list[Card] = (), num_opponents=1,
+               ci_width=0.01, confidence=0.95, time_budget=None, max_samples=1_000_000):
+        """ Estimate how often the hole cards win, tie and lose.
+
+        Args:
+            hole_cards: the player's two cards
+            board: the 0 to 5 face up cards so far
+            num_opponents: number of opponents holding random cards
+            ci_width: stop once the confidence interval on the equity is this wide
+            confidence: confidence level of that interval
+            time_budget: stop after this many seconds, if given
+            max_samples: never draw more samples than this
+
+        Returns:
+            dict of the win, tie and lose probabilities, the equity (wins plus
+            shares of ties), the number of samples and the interval's half width,
+            and whether the answer is exact
+        """
+        board = list(board)
+        assert len(hole_cards) == 2 and len(board) <= 5
+        assert 2 + len(board) + 2 * num_opponents + (5 - len(board)) <= 52
+        if self.cache is None:
+            return self._estimate(hole_cards, board, num_opponents, ci_width, confidence, time_budget, max_samples)
+        key = (canonical_key(hole_cards, board), num_opponents, ci_width, confidence, max_samples)
+        # an answer cut short by the time budget is not what the key asks for, so it is not kept
+        return dict(self.cache.get(key, lambda: self._estimate(
+            hole_cards, board, num_opponents, ci_width, confidence, time_budget, max_samples),
+            lambda result: result['exact'] or result['samples'] >= max_samples or 2 * result['ci_half_width'] <= ci_width))
+
+    def _estimate(self, hole_cards, board, num_opponents, ci_width, confidence, time_budget, max_samples):
+        if num_completions(hole_cards, board, num_opponents) <= self.exact_limit:
+            return exact_equity(hole_cards, board, num_opponents)
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        start = time.perf_counter()
+        args = ([card.id for card in hole_cards], [card.id for card in board], num_opponents)
+        totals = [0, 0, 0, 0.0, 0.0]
+        submitted = 0
+
+        def half_width():
+            n = totals[0] + totals[1] + totals[2]
+            mean = totals[3] / n
+            return z * (max(totals[4] / n - mean ** 2, 0.0) / n) ** 0.5
+
+        def finished():
+            n = totals[0] + totals[1] + totals[2]
+            return (n >= max_samples
+                    or (n >= 2 * self.batch_size and 2 * half_width() <= ci_width)
+                    or (time_budget is not None and time.perf_counter() - start >= time_budget))
+
+        def next_batch():
+            nonlocal submitted
+            size = min(self.batch_size, max_samples - submitted)
+            submitted += size
+            return args + (size, self.seed_sequence.spawn(1)[0])
+
+        def add(counts):
+            for i, count in enumerate(counts):
+                totals[i] += count
+
+        if self.pool is None:
+            add(sample_counts(*next_batch()))
+            while not finished():
+                add(sample_counts(*next_batch()))
+        else:
+            pending = {self.pool.submit(sample_counts, *next_batch())
+                       for _ in range(2 * self.processes) if submitted < max_samples}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    add(future.result())
+                if finished():
+                    for future in pending:
+                        future.cancel()
+                    break
+                while len(pending) < 2 * self.processes and submitted < max_samples:
+                    pending.add(self.pool.submit(sample_counts, *next_batch()))
+
+        n = totals[0] + totals[1] + totals[2]
+        return {'win': totals[0] / n, 'tie': totals[1] / n, 'lose': totals[2] / n,
+                'equity': totals[3] / n, 'samples': n, 'ci_half_width': half_width(), 'exact': False}
+
+_default_calculator = None
+
+def equity(hole_cards: list[Card], board: list[Card] = (), num_opponents=1, **kwargs):
+    """ EquityCalculator.equity on a shared in-process calculator."""
+    global _default_calculator
+    if _default_calculator is None:
+        _default_calculator = EquityCalculator()
+    return _default_calculator.equity(hole_cards, board, num_opponents, **kwargs)
+
+
+def test_pocket_aces():
+    calculator = EquityCalculator(seed=0)
+    result = calculator.equity([Card('hearts', 14), Card('spades', 14)], ci_width=0.02)
+    assert abs(result['equity'] - 0.852) < 0.02
+    assert abs(result['win'] + result['tie'] + result['lose'] - 1) < 1e-9
+    assert 2 * result['ci_half_width'] <= 0.02
+
+def test_seeded_and_cached():
+    hole = [Card('clubs', 9), Card('clubs', 8)]
+    board = [Card('clubs', 2), Card('hearts', 13), Card('clubs', 11)]
+    first = EquityCalculator(seed=5).equity(hole, board, 3, ci_width=0.05)
+    assert first == EquityCalculator(seed=5).equity(hole, board, 3, ci_width=0.05)
+    calculator = EquityCalculator(seed=5)
+    calculator.equity(hole, board, 3, ci_width=0.05)
+    relabelled = [Card('spades', 9), Card('spades', 8)], [Card('spades', 2), Card('diamonds', 13), Card('spades', 11)]
+    assert calculator.equity(*relabelled, 3, ci_width=0.05) == first
+    assert calculator.cache.hits == 1
+
+def test_nuts_and_time_budget():
+    hole = [Card('hearts', 14), Card('hearts', 13)]
+    board = [Card('hearts', 12), Card('hearts', 11), Card('hearts', 10), Card('clubs', 2), Card('spades', 3)]
+    result = EquityCalculator(seed=1, cache_size=0).equity(hole, board, 4, time_budget=0, max_samples=10000)
+    assert result['win'] == 1 and result['samples'] == 2000
+
+def test_time_budget_not_cached():
+    hole = [Card('hearts', 2), Card('clubs', 7)]
+    calculator = EquityCalculator(seed=4)
+    rushed = calculator.equity(hole, num_opponents=2, ci_width=0.01, time_budget=0)
+    assert rushed['samples'] == 2000 and 2 * rushed['ci_half_width'] > 0.01
+    full = calculator.equity(hole, num_opponents=2, ci_width=0.01)
+    assert full['samples'] > 2000 and 2 * full['ci_half_width'] <= 0.01
+    assert calculator.equity(hole, num_opponents=2, ci_width=0.01, time_budget=0) == full
+    assert calculator.cache.hits == 1
+
+def test_exact_equity():
+    hole = [Card('hearts', 14), Card('hearts', 13)]
+    board = [Card('hearts', 12), Card('hearts', 11), Card('clubs', 2), Card('spades', 3)]
+    result = exact_equity(hole, board, 1)
+    # nine hearts make a flush or better and three more tens a straight
+    assert result['samples'] == num_completions(hole, board, 1) == 46 * comb(45, 2)
+    assert result['exact'] and result['win'] > 0.6
+    two_opponents = exact_equity(hole, board + [Card('hearts', 10)], 2)
+    assert two_opponents['win'] == 1 and two_opponents['samples'] == comb(45, 2) * comb(43, 2)
+
+    sampled = EquityCalculator(seed=3, exact_limit=0).equity(hole, board, 1, ci_width=0.01)
+    assert not sampled['exact'] and abs(sampled['equity'] - result['equity']) < 0.01
+    assert EquityCalculator().equity(hole, board, 1) == result
+
+def test_process_pool():
+    with EquityCalculator(processes=2, seed=2, batch_size=500) as calculator:
+        result = calculator.equity([Card('hearts', 2), Card('clubs', 7)], num_opponents=2, max_samples=4000, ci_width=0)
+    assert result['samples'] == 4000
+    assert 0.1 < result['equity'] < 0.3
+
+if __name__ == "__main__":
+    test_pocket_aces()
+    test_seeded_and_cached()
+    test_nuts_and_time_budget()
+    test_time_budget_not_cached()
+    test_exact_equity()
+    test_process_pool()
@@ -1,6 +1,8 @@
-from cards import Card, suits
+from cards import Card, Pack, suits, cards_by_id
 import random
 from collections import Counter
+from itertools import combinations
+import numpy as np
 
 class EqualsError(Exception):
     pass
@@ -18,13 +20,374 @@ values = {
     'royal flush': 9
 }
 
+# Every 5-card hand is given a strength from 1 (7-5-4-3-2 offsuit) to 7462
+# (a royal flush), so that comparing two hands is a single integer
+# comparison.  The strengths are assigned once, here, by listing every class
+# of equal hands from worst to best; a hand is then looked up by the same
+# three tables as Cactus Kev's evaluator:
+#   _flushes  - suited hands, by the bit mask of their ranks
+#   _unique5  - straights and high cards (five different ranks), by rank mask
+#   _products - everything else, by the product of one prime per rank
+primes = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41]
+
+# per card id: prime in bits 0-7, rank in bits 8-11, suit in bits 12-15 and
+# the rank bit in bits 16-28
+_card_keys = tuple(primes[id >> 2] | (id >> 2) << 8 | 1 << (12 + (id & 3)) | 1 << (16 + (id >> 2))
+                   for id in range(52))
+
+_flushes = [0] * 8192
+_unique5 = [0] * 8192
+_products = {}
+_scores = [None] # evaluation() output for each strength, strength 0 is unused
+_categories = [None]
+_hand_values = [None] # the card values making up a hand of each strength
+
+def _rank_mask(hand_values):
+    mask = 0
+    for value in hand_values:
+        mask |= 1 << (value - 2)
+    return mask
+
+def _prime_product(hand_values):
+    product = 1
+    for value in hand_values:
+        product *= primes[value - 2]
+    return product
+
+def _build_tables():
+    straights = [(5, 4, 3, 2, 14)] + [tuple(range(top, top - 5, -1)) for top in range(6, 15)]
+    straight_masks = {_rank_mask(straight) for straight in straights}
+    descending = range(14, 1, -1)
+    no_straights = [hand for hand in reversed(list(combinations(descending, 5)))
+                    if _rank_mask(hand) not in straight_masks]
+
+    def others(*used):
+        return [value for value in descending if value not in used]
+
+    # (category, score, values of the five cards, table), worst to best
+    classes = []
+    for hand in no_straights:
+        classes.append((values['high card'], hand, hand, _unique5))
+    for pair in range(2, 15):
+        for kickers in reversed(list(combinations(others(pair), 3))):
+            classes.append((values['pair'], (pair,) + kickers, (pair, pair) + kickers, _products))
+    for high in range(3, 15):
+        for low in range(2, high):
+            for kicker in reversed(others(high, low)):
+                classes.append((values['two pair'], (high, low, kicker), (high, high, low, low, kicker), _products))
+    for three in range(2, 15):
+        for kickers in reversed(list(combinations(others(three), 2))):
+            classes.append((values['three of a kind'], (three,) + kickers, (three,) * 3 + kickers, _products))
+    for straight in straights:
+        classes.append((values['straight'], straight[:1], straight, _unique5))
+    for hand in no_straights:
+        classes.append((values['flush'], hand, hand, _flushes))
+    for three in range(2, 15):
+        for pair in reversed(others(three)):
+            classes.append((values['full house'], (three, pair), (three,) * 3 + (pair,) * 2, _products))
+    for four in range(2, 15):
+        for kicker in reversed(others(four)):
+            classes.append((values['four of a kind'], (four, kicker), (four,) * 4 + (kicker,), _products))
+    for straight in straights[:-1]:
+        classes.append((values['straight flush'], straight[:1], straight, _flushes))
+    classes.append((values['royal flush'], (), straights[-1], _flushes))
+
+    # the hands must be sorted within each category for the strengths to be right
+    for category in values.values():
+        scores = [score for cat, score, _, _ in classes if cat == category]
+        assert scores == sorted(scores)
+
+    for strength, (category, score, hand_values, table) in enumerate(classes, start=1):
+        if table is _products:
+            table[_prime_product(hand_values)] = strength
+        else:
+            table[_rank_mask(hand_values)] = strength
+        _scores.append((category,) + score)
+        _categories.append(category)
+        _hand_values.append(hand_values)
+
+_build_tables()
+max_strength = len(_scores) - 1
+
+def _values_strength(hand_values):
+    mask = _rank_mask(hand_values)
+    if mask.bit_count() == 5:
+        return _unique5[mask]
+    return _products[_prime_product(hand_values)]
+
+def _best_straight(mask):
+    """ Values of the highest straight among the ranks in mask, or None."""
+    for top in range(14, 5, -1):
+        straight = 0b11111 << (top - 6)
+        if mask & straight == straight:
+            return tuple(range(top, top - 5, -1))
+    if mask & 0b1000000001111 == 0b1000000001111:
+        return (5, 4, 3, 2, 14)
+    return None
+
+def _mask_values(mask):
+    return [value for value in range(14, 1, -1) if mask >> (value - 2) & 1]
+
+# best strength of the flushes in a suit holding the ranks in the mask
+_best_flush = [0] * 8192
+for mask in range(8192):
+    if mask.bit_count() >= 5:
+        straight = _best_straight(mask)
+        _best_flush[mask] = _flushes[_rank_mask(straight if straight else _mask_values(mask)[:5])]
+del mask, straight
+
+# best strength of 5 to 7 cards without a flush, by the product of their rank
+# primes; filled in as rank combinations are met, there are 49205 of them
+_best_unsuited = {}
+
+def _best_unsuited_strength(product):
+    counts = [0] * 15
+    for value in range(2, 15):
+        while product % primes[value - 2] == 0:
+            product //= primes[value - 2]
+            counts[value] += 1
+    by_count = {count: [value for value in range(14, 1, -1) if counts[value] == count] for count in range(1, 5)}
+    fours, threes, pairs = by_count[4], by_count[3], by_count[2]
+    present = [value for value in range(14, 1, -1) if counts[value]]
+
+    if fours:
+        kicker = [value for value in present if value != fours[0]][0]
+        return _values_strength((fours[0],) * 4 + (kicker,))
+    if threes and len(threes + pairs) >= 2:
+        pair = max(threes[1:] + pairs)
+        return _values_strength((threes[0],) * 3 + (pair,) * 2)
+    straight = _best_straight(_rank_mask(present))
+    if straight:
+        return _unique5[_rank_mask(straight)]
+    if threes:
+        return _values_strength((threes[0],) * 3 + tuple(by_count[1][:2]))
+    if len(pairs) >= 2:
+        kicker = [value for value in present if value not in pairs[:2]][0]
+        return _values_strength((pairs[0],) * 2 + (pairs[1],) * 2 + (kicker,))
+    if pairs:
+        return _values_strength((pairs[0],) * 2 + tuple(by_count[1][:3]))
+    return _unique5[_rank_mask(present[:5])]
+
+def best_strength(ids: list[int]) -> int:
+    """ Strength of the best 5-card hand within 5 to 7 cards, given by id."""
+    suit_masks = [0, 0, 0, 0]
+    product = 1
+    for id in ids:
+        suit_masks[id & 3] |= 1 << (id >> 2)
+        product *= primes[id >> 2]
+    return _masks_strength(suit_masks, product)
+
+def _masks_strength(suit_masks, product):
+    for mask in suit_masks:
+        # with at most 7 cards, a flush beats anything the other cards could make
+        if mask.bit_count() >= 5:
+            return _best_flush[mask]
+    strength = _best_unsuited.get(product)
+    if strength is None:
+        strength = _best_unsuited[product] = _best_unsuited_strength(product)
+    return strength
+
+# the category of fewer than 5 cards, by the sorted counts of their ranks
+_partial_categories = {(4,): values['four of a kind'], (3,): values['three of a kind'],
+                       (2, 2): values['two pair'], (2,): values['pair']}
+
+class HandState:
+    """ The cards of a hand as they arrive, one at a time.
+
+    Each card updates the suit masks and prime product best_strength builds,
+    so a player's hand grows street by street without starting over, and
+    the strength is looked up again only after a card has been added.
+    """
+    __slots__ = ('suit_masks', 'product', 'num_cards', '_strength')
+
+    def __init__(self, ids=()):
+        self.suit_masks = [0, 0, 0, 0]
+        self.product = 1
+        self.num_cards = 0
+        self._strength = None
+        for id in ids:
+            self.add(id)
+
+    def add(self, id):
+        bit = 1 << (id >> 2)
+        assert not self.suit_masks[id & 3] & bit, "duplicate card"
+        self.suit_masks[id & 3] |= bit
+        self.product *= primes[id >> 2]
+        self.num_cards += 1
+        self._strength = None
+
+    def copy(self):
+        """ The same cards so far, as a HandState of their own to add more to."""
+        state = HandState.__new__(HandState)
+        state.suit_masks = self.suit_masks[:]
+        state.product = self.product
+        state.num_cards = self.num_cards
+        state._strength = self._strength
+        return state
+
+    def strength(self) -> int:
+        """ Strength of the best 5-card hand, once there are 5 to 7 cards."""
+        assert 5 <= self.num_cards <= 7
+        if self._strength is None:
+            self._strength = _masks_strength(self.suit_masks, self.product)
+        return self._strength
+
+    def category(self) -> int:
+        """ The `values` category of the best hand, which for fewer than 5 cards can only be made of matching ranks."""
+        if self.num_cards >= 5:
+            return _categories[self.strength()]
+        a, b, c, d = self.suit_masks
+        counts = tuple(sorted((count for count in ((a >> rank & 1) + (b >> rank & 1) + (c >> rank & 1) + (d >> rank & 1)
+                                                   for rank in range(13)) if count > 1), reverse=True))
+        return _partial_categories.get(counts, values['high card'])
+
+def best_hand(cards: list[Card]) -> tuple[int, list[Card]]:
+    """ The strength of the best 5-card hand within 5 to 7 cards, and the 5 cards."""
+    assert 5 <= len(cards) <= 7
+    # check for duplicate cards
+    assert len({card.id for card in cards}) == len(cards)
+    strength = best_strength([card.id for card in cards])
+    return strength, hand_for_strength(strength, cards)
+
+def hand_for_strength(strength: int, cards: list[Card]) -> list[Card]:
+    """ The 5 of these cards that make a hand of the given strength, their best hand."""
+    if _categories[strength] in (values['flush'], values['straight flush'], values['royal flush']):
+        suit = Counter(card.suit for card in cards).most_common(1)[0][0]
+        cards = [card for card in cards if card.suit == suit]
+    hand = []
+    remaining = list(cards)
+    for value in _hand_values[strength]:
+        card = next(card for card in remaining if card.value == value)
+        remaining.remove(card)
+        hand.append(card)
+    return hand
+
+def strength5(a: int, b: int, c: int, d: int, e: int) -> int:
+    """ Strength of the five cards with ids a to e; a higher strength is a better hand."""
+    a, b, c, d, e = _card_keys[a], _card_keys[b], _card_keys[c], _card_keys[d], _card_keys[e]
+    mask = (a | b | c | d | e) >> 16
+    if a & b & c & d & e & 0xF000:
+        return _flushes[mask]
+    strength = _unique5[mask]
+    if strength:
+        return strength
+    return _products[(a & 0xFF) * (b & 0xFF) * (c & 0xFF) * (d & 0xFF) * (e & 0xFF)]
+
+def hand_strength(cards: list[Card]) -> int:
+    assert len(cards) == 5
+    a, b, c, d, e = cards
+    # check for duplicate cards
+    assert (a.bit | b.bit | c.bit | d.bit | e.bit).bit_count() == 5
+    return strength5(a.id, b.id, c.id, d.id, e.id)
+
+def hand_category(strength: int) -> int:
+    """ The entry of `values` that a hand of this strength belongs to."""
+    return _categories[strength]
+
+def strength_score(strength: int) -> list:
+    """ evaluation() output for a hand of this strength."""
+    return list(_scores[strength])
+
 def evaluation(cards: list[Card]):
+    """ [category, tie-breaking card values...] for a 5-card hand.
+
+    Kept for callers that want the readable form; compare hands with
+    hand_strength instead.
+    """
+    return list(_scores[hand_strength(cards)])
+
+def equals(hand1: list[Card], hand2: list[Card]):
+    return hand_strength(hand1) == hand_strength(hand2)
+
+
+def beats(hand_1: list[Card], hand_2: list[Card]) -> bool:
+    """ Does hand_1 beat hand_2?
+
+    Raise an error if hands are equal.
+    """
+    strength1 = hand_strength(hand_1)
+    strength2 = hand_strength(hand_2)
+    if strength1 == strength2:
+        raise EqualsError("The hands have equal value, this function shouldn't be used")
+    return strength1 > strength2
+
+
+def winners(hands: list):
+    """ Indices of the strongest of these 5-card hands; more than one if they tie."""
+    return winners_by_strength([hand_strength(hand) for hand in hands])
+
+
+def winners_by_strength(strengths: list[int]):
+    """ Indices of the highest of these precomputed strengths, found in one pass."""
+    highest = 0
+    indices = set()
+    for i, strength in enumerate(strengths):
+        if strength > highest:
+            highest = strength
+            indices = {i}
+        elif strength == highest:
+            indices.add(i)
+    return indices
+
+
+_batch_tables = None
+
+def _get_batch_tables():
+    """ The lookup tables as arrays, built on first use."""
+    global _batch_tables
+    if _batch_tables is None:
+        products = np.array(sorted(_products), dtype=np.int64)
+        _batch_tables = {
+            'card_keys': np.array(_card_keys, dtype=np.int64),
+            'flushes': np.array(_flushes, dtype=np.int32),
+            'unique5': np.array(_unique5, dtype=np.int32),
+            'products': products,
+            'product_strengths': np.array([_products[product] for product in products], dtype=np.int32),
+            'categories': np.array([-1] + _categories[1:], dtype=np.int8),
+        }
+    return _batch_tables
+
+def _batch_strength5(keys, tables):
+    """ Strengths of an (N, 5) array of card keys."""
+    mask = np.bitwise_or.reduce(keys, axis=1) >> 16
+    is_flush = (np.bitwise_and.reduce(keys, axis=1) & 0xF000) != 0
+    strengths = np.where(is_flush, tables['flushes'][mask], tables['unique5'][mask])
+    paired = strengths == 0
+    products = np.prod(keys[paired] & 0xFF, axis=1)
+    strengths[paired] = tables['product_strengths'][np.searchsorted(tables['products'], products)]
+    return strengths
+
+def evaluate_batch(ids, rank_table=None) -> tuple[np.ndarray, np.ndarray]:
+    """ Strengths and categories of many hands at once.
+
+    Args:
+        ids: (N, 5), (N, 6) or (N, 7) integer array of card ids, one hand per row.
+        rank_table: optional rank_table.RankTable to look 5-card hands up in instead of computing them
+
+    Returns:
+        (N,) int32 array of best-hand strengths and (N,) int8 array of the matching `values` categories
+    """
+    ids = np.asarray(ids)
+    assert ids.ndim == 2 and 5 <= ids.shape[1] <= 7
+    tables = _get_batch_tables()
+    if rank_table is not None:
+        strength5 = lambda columns: rank_table.lookup(ids[:, columns])
+    else:
+        keys = tables['card_keys'][ids]
+        strength5 = lambda columns: _batch_strength5(keys[:, columns], tables)
+    strengths = strength5([0, 1, 2, 3, 4])
+    # larger hands take the best of each way of choosing 5 columns
+    for columns in list(combinations(range(ids.shape[1]), 5))[1:]:
+        np.maximum(strengths, strength5(list(columns)), out=strengths)
+    return strengths, tables['categories'][strengths]
+
+
+def reference_evaluation(cards: list[Card]):
+    """ The original, table-free evaluation, kept to check the tables against."""
     assert len(cards) == 5
 
     # check for duplicate cards
-    for i in range(len(cards)):
-        for j in range(i+1, len(cards)):
-            assert not (cards[i].value == cards[j].value and cards[i].suit == cards[j].suit)
+    assert len({card.id for card in cards}) == 5
     cards = sorted(cards)
 
     values_counts = Counter(card.value for card in cards)
@@ -44,8 +407,9 @@ def evaluation(cards: list[Card]):
     if is_royal:
         # print("royal flush"*100)
         return [values['royal flush']] # None
+    low_ace = cards[-1].value == 14 and cards[0].value == 2
     if is_straight and is_flush:
-        return [values['straight flush']] + [cards[-1].value] # value of highest card
+        return [values['straight flush']] + ([cards[-1].value] if not low_ace else [5]) # value of highest card
     if is_four_oak:
         return [values['four of a kind']] + [counts_values[4], counts_values[1]] # value of 4s, value of 1
     if is_full_house:
@@ -53,7 +417,6 @@ def evaluation(cards: list[Card]):
     if is_flush:
         return [values['flush']] + [card.value for card in cards[::-1]] # value of top, second top, etc. down to last card
     if is_straight:
-        low_ace = cards[-1].value == 14 and cards[0].value == 2
         return [values['straight']] + ([cards[-1].value] if not low_ace else [5]) # value of top card or 5 if low ace
     if is_three_oak:
         ones = sorted([[count, value] for value, count in values_counts.items() if count == 1], key=lambda x: x[1])
@@ -66,53 +429,6 @@ def evaluation(cards: list[Card]):
         return [values['pair'], counts_values[2], ones[2][1], ones[1][1], ones[0][1]] # value of pair, each value of other 3
     return [values['high card']] + [card.value for card in reversed(cards)] # value of all 5 going down
 
-def equals(hand1: list[Card], hand2: list[Card]):
-    scores1 = evaluation(hand1)
-    scores2 = evaluation(hand2)
-
-    rank1 = scores1.pop(0)
-    rank2 = scores2.pop(0)
-
-    return scores1 == scores2 if rank1 == rank2 else False
-
-
-def beats(hand_1: list[Card], hand_2: list[Card]) -> bool:
-    """ Does hand_1 beat hand_2?
-
-    Raise an error if hands are equal.
-    """
-    scores1 = evaluation(hand_1)
-    scores2 = evaluation(hand_2)
-
-    rank1 = scores1.pop(0)
-    rank2 = scores2.pop(0)
-
-    if rank1 != rank2:
-        return rank1 > rank2
-    else:
-        for index in range(len(scores1)):
-            if scores1[index] != scores2[index]:
-                return scores1 > scores2
-    raise EqualsError("The hands have equal value, this function shouldn't be used")
-
-
-def winners(hands: list):
-    # Evaluate all hands and find the maximum main score
-    scores = [evaluation(hand) for hand in hands]
-    highest_score = max(score[0] for score in scores)
-
-    # Filter hands with the highest main score
-    candidates = [hand for hand, score in zip(hands, scores) if score[0] == highest_score]
-
-    # Determine the strongest hands among the candidates
-    strongest_hands = []
-    for hand in candidates:
-        if all(equals(hand, other) or beats(hand, other) for other in candidates if hand != other):
-            strongest_hands.append(hand)
-
-    # Find the indices of the strongest hands in the original list
-    return {i for i, hand in enumerate(hands) if hand in strongest_hands}
-
 
 def test_flush():
     cards = []
@@ -191,6 +507,58 @@ def test_royal_flush():
     cards.append(Card('hearts', 14))
     assert evaluation(cards) == [9]
 
+def test_low_ace_straight_flush():
+    cards = [Card('clubs', value) for value in [14, 2, 3, 4, 5]]
+    assert evaluation(cards) == reference_evaluation(cards) == [8, 5]
+    cards[0] = Card('clubs', 6)
+    assert evaluation(cards) == [8, 6]
+
+def test_matches_reference_evaluation():
+    pack = Pack()
+    for _ in range(1000):
+        pack.shuffle()
+        hand = pack.cards[:5]
+        assert evaluation(hand) == reference_evaluation(hand)
+
+def test_strengths_order_like_scores():
+    assert max_strength == 7462
+    scores = [strength_score(strength) for strength in range(1, max_strength + 1)]
+    for lower, higher in zip(scores, scores[1:]):
+        assert lower[0] < higher[0] or (lower[0] == higher[0] and lower[1:] < higher[1:])
+    assert [hand_category(strength) for strength in (1, max_strength)] == [values['high card'], values['royal flush']]
+
+def test_best_hand_seven_cards():
+    board = [Card('hearts', 14), Card('hearts', 13), Card('clubs', 13), Card('hearts', 4), Card('spades', 2)]
+    strength, hand = best_hand(board + [Card('hearts', 9), Card('hearts', 7)])
+    assert evaluation(hand) == [5, 14, 13, 9, 7, 4]
+    assert best_strength([card.id for card in board + [Card('diamonds', 13), Card('clubs', 2)]]) == \
+        hand_strength([Card('hearts', 13), Card('clubs', 13), Card('diamonds', 13), Card('spades', 2), Card('clubs', 2)])
+    strength, hand = best_hand(board + [Card('diamonds', 3), Card('clubs', 5)])
+    assert evaluation(hand) == [4, 5]
+    assert strength == hand_strength(hand)
+
+def test_best_hand_matches_best_combination():
+    pack = Pack()
+    for num_cards in [5, 6, 7] * 300:
+        pack.shuffle()
+        cards = pack.cards[:num_cards]
+        strength, hand = best_hand(cards)
+        assert strength == hand_strength(hand) == max(hand_strength(list(five)) for five in combinations(cards, 5))
+        assert all(card in cards for card in hand)
+
+def test_evaluate_batch():
+    pack = Pack()
+    for num_cards in [5, 7]:
+        hands = []
+        for _ in range(500):
+            pack.shuffle()
+            hands.append(pack.ids[:num_cards])
+        strengths, categories = evaluate_batch(hands)
+        hands = [[cards_by_id[id] for id in hand] for hand in hands]
+        assert strengths.shape == categories.shape == (500,)
+        assert list(strengths) == [best_hand(hand)[0] for hand in hands]
+        assert list(categories) == [hand_category(strength) for strength in strengths]
+
 def test_compare_higher_flush():
     hand1 = [
         Card('hearts', 5),
@@ -435,6 +803,31 @@ def test_winners_straights():
     hands = [hand1, hand2, hand3]
     assert winners(hands) == {2}
 
+def test_hand_state():
+    rng = random.Random(4)
+    for _ in range(200):
+        ids = rng.sample(range(52), 7)
+        state = HandState(ids[:2])
+        assert state.category() == (values['pair'] if ids[0] >> 2 == ids[1] >> 2 else values['high card'])
+        for count in range(3, 8):
+            state.add(ids[count - 1])
+            if count >= 5:
+                assert state.strength() == best_strength(ids[:count])
+                assert state.category() == hand_category(best_strength(ids[:count]))
+        board = HandState(ids[2:])
+        hand = board.copy()
+        hand.add(ids[0])
+        hand.add(ids[1])
+        assert hand.strength() == state.strength() and board.num_cards == 5 # the copy is the one that grew
+    assert HandState([0, 1, 2, 5]).category() == values['three of a kind']
+    assert HandState([0, 1, 5, 6]).category() == values['two pair']
+    assert HandState([0, 1, 2, 3]).category() == values['four of a kind']
+
+def test_winners_by_strength():
+    assert winners_by_strength([12, 7462, 30, 7462]) == {1, 3}
+    assert winners_by_strength([5]) == {0}
+    assert winners_by_strength([]) == set()
+
 if __name__ == "__main__":
     test_flush()
     test_straight()
@@ -445,6 +838,12 @@ if __name__ == "__main__":
     test_pair()
     test_high_card()
     test_royal_flush()
+    test_low_ace_straight_flush()
+    test_matches_reference_evaluation()
+    test_strengths_order_like_scores()
+    test_best_hand_seven_cards()
+    test_best_hand_matches_best_combination()
+    test_evaluate_batch()
     test_compare_higher_card()
     test_compare_higher_flush()
     test_compare_royal_flush_split_pot()
@@ -455,4 +854,6 @@ if __name__ == "__main__":
     test_winners_3_winners()
     test_winners_2_winners()
     test_winners_1_winner()
-    test_winners_straights()
\ No newline at end of file
+    test_winners_straights()
+    test_hand_state()
+    test_winners_by_strength()
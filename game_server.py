@@ -0,0 +1,448 @@
+""" Host many tables in one process for agents that play seats over a local socket.
+
+    python game_server.py --tables 200 --port 9999           # TCP on localhost
+    python game_server.py --tables 200 --unix /tmp/poker.sock
+
+Each table has remote_seats seats for agents and fills the rest with bots.
+Tables start once their agent seats are taken and all run on one asyncio
+loop: a table waiting on an agent's decision yields to the others, and an
+agent that does not answer within the decision timeout folds.
+
+Messages are fixed-size little-endian structs after a one-byte type:
+    agent -> host  H  seats (u16), name length (u16), name (utf-8)     ask for seats
+    host -> agent  S  table (u32), seat (u8)                           one per seat given
+    host -> agent  B/M  request (u32), table (u32), seat (u8), hand (u32), hole (2 x i8),
+                   board (5 x i8, -1 if not dealt), money, highest bet, recent bet (f64)
+                                                                       bet or match?
+    agent -> host  A  request (u32), yes (u8), amount (f64)            the answer; a match's
+                                                                       amount is set by the host
+    host -> agent  R  table (u32), seat (u8), hand (u32), money (f64), won (u8)
+                                                                       after each hand
+    host -> agent  E  table (u32)                                      the table has finished
+"""
+from table import Table
+from player import Player, RandomPlayer, AutomaticPlayer
+import argparse
+import asyncio
+import inspect
+import struct
+
+HELLO = struct.Struct('<HH')
+SEAT = struct.Struct('<IB')
+DECIDE = struct.Struct('<IIBI2b5bddd')
+ANSWER = struct.Struct('<IBd')
+RESULT = struct.Struct('<IBIdB')
+END = struct.Struct('<I')
+
+class ProtocolError(Exception):
+    pass
+
+class RemotePlayer(Player):
+    """ A seat played by an agent: place_bet and match are coroutines that wait for its answer."""
+    def __init__(self, name, money, connection, table_index, seat, timeout):
+        super().__init__(name, money)
+        self.connection = connection
+        self.table_index = table_index
+        self.seat = seat
+        self.timeout = timeout
+        self.hand = 0
+        self.timeouts = 0
+
+    async def ask(self, kind, table_cards, high_bet):
+        hole = [card.id for card in self.cards]
+        board = [card.id for card in table_cards] + [-1] * (5 - len(table_cards))
+        try:
+            answer = await self.connection.ask(kind, self.table_index, self.seat, self.hand, hole, board, self.money,
+                                         high_bet, self.recent_bet)
+            return await asyncio.wait_for(answer, self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+        except ConnectionError:
+            pass
+        return False, 0.0 # no answer folds
+
+    async def place_bet(self, table_cards, max_bet_so_far):
+        self.recent_bet = 0 # nothing put in yet this round, whatever was last hand
+        bet, amount = await self.ask(b'B', table_cards, max_bet_so_far)
+        # the same checks the other players make of their own bets
+        if not bet or not 0 <= amount <= self.money or amount < max_bet_so_far:
+            return False, None
+        self.recent_bet = amount
+        return True, amount
+
+    async def match(self, table_cards, high_bet):
+        if self.recent_bet == high_bet:
+            return True, 0
+        difference = high_bet - self.recent_bet
+        match, _ = await self.ask(b'M', table_cards, high_bet)
+        if not match or difference >= self.money:
+            return False, None
+        return True, difference
+
+class Connection:
+    """ One agent's socket, which can play seats at any number of tables at once."""
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {} # request number -> future of the answer
+        self.next_request = 0
+        self.closed = False
+
+    async def send(self, kind, message_struct, *fields):
+        if self.closed:
+            return
+        self.writer.write(kind + message_struct.pack(*fields))
+        try:
+            await self.writer.drain() # wait while an agent that reads slowly has a full buffer
+        except ConnectionError:
+            self.closed = True
+
+    async def ask(self, kind, table_index, seat, hand, hole, board, money, highest_bet, recent_bet):
+        """ Send a decision request; the future of its answer."""
+        if self.closed:
+            raise ConnectionError("agent disconnected")
+        request = self.next_request
+        self.next_request = (request + 1) % 2 ** 32
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request] = future
+        future.add_done_callback(lambda _: self.pending.pop(request, None))
+        await self.send(kind, DECIDE, request, table_index, seat, hand, *hole, *board, money, highest_bet, recent_bet)
+        if self.closed and not future.done():
+            future.set_exception(ConnectionError("agent disconnected"))
+        return future
+
+    async def read_answers(self):
+        try:
+            while True:
+                kind = await self.reader.readexactly(1)
+                if kind != b'A':
+                    raise ProtocolError(f"unexpected message {kind!r}")
+                request, yes, amount = ANSWER.unpack(await self.reader.readexactly(ANSWER.size))
+                future = self.pending.get(request)
+                if future is not None and not future.done(): # a late answer to a timed out request is dropped
+                    future.set_result((bool(yes), amount))
+        except (asyncio.IncompleteReadError, ConnectionError, ProtocolError):
+            pass
+        finally:
+            self.closed = True
+            for future in list(self.pending.values()):
+                if not future.done():
+                    future.set_exception(ConnectionError("agent disconnected"))
+
+async def _decision(decision):
+    return await decision if inspect.isawaitable(decision) else decision
+
+async def _decide(steps):
+    """ table.decide_now, waiting for the decisions of players that decide asynchronously."""
+    try:
+        decision = next(steps)
+        while True:
+            decision = steps.send(await _decision(decision))
+    except StopIteration:
+        pass
+
+async def play_hand(table: Table, streets=False):
+    """ Table.play_hand, or Table.play_streets with streets, waiting for players that decide asynchronously."""
+    for _ in table.betting_rounds(streets):
+        await _decide(table.bets())
+        await _decide(table.matches())
+    return table.finish_hand()
+
+class GameHost:
+    """ num_tables tables of seats_per_table, remote_seats of them played by agents and the rest by bot_class.
+
+    Each table plays num_hands hands once its agent seats are taken, betting
+    street by street with streets.
+    """
+    def __init__(self, num_tables, seats_per_table=4, remote_seats=1, num_hands=100, initial_money=100,
+                 decision_timeout=1.0, bot_class=RandomPlayer, streets=False):
+        assert 1 <= remote_seats <= seats_per_table
+        self.num_tables = num_tables
+        self.seats_per_table = seats_per_table
+        self.remote_seats = remote_seats
+        self.num_hands = num_hands
+        self.initial_money = initial_money
+        self.decision_timeout = decision_timeout
+        self.bot_class = bot_class
+        self.streets = streets
+        self.open_seats = [(table_index, seat) for table_index in range(num_tables) for seat in range(remote_seats)]
+        self.seated = {table_index: [] for table_index in range(num_tables)}
+        self.tables = {}
+        self.games = []
+        self.connections = []
+        self.finished = asyncio.Event()
+        self.tables_finished = 0
+
+    async def handle(self, reader, writer):
+        connection = Connection(reader, writer)
+        self.connections.append(connection)
+        try:
+            if await reader.readexactly(1) != b'H':
+                raise ProtocolError("expected hello")
+            num_seats, name_length = HELLO.unpack(await reader.readexactly(HELLO.size))
+            name = (await reader.readexactly(name_length)).decode()
+        except (asyncio.IncompleteReadError, ProtocolError, UnicodeDecodeError):
+            writer.close()
+            return
+        given, self.open_seats = self.open_seats[:num_seats], self.open_seats[num_seats:]
+        for table_index, seat in given:
+            await connection.send(b'S', SEAT, table_index, seat)
+            player = RemotePlayer(f"{name} {table_index}.{seat}", self.initial_money, connection, table_index, seat,
+                                  self.decision_timeout)
+            self.seated[table_index].append(player)
+            if len(self.seated[table_index]) == self.remote_seats:
+                self.games.append(asyncio.create_task(self.play_table(table_index)))
+        await connection.read_answers()
+        writer.close()
+
+    async def play_table(self, table_index):
+        remote = self.seated[table_index]
+        bots = [self.bot_class(f"Bot {table_index}.{seat}", self.initial_money)
+                for seat in range(self.remote_seats, self.seats_per_table)]
+        table = self.tables[table_index] = Table(remote + bots)
+        try:
+            for hand in range(self.num_hands):
+                for player in remote:
+                    player.hand = hand
+                winners = await play_hand(table, self.streets)
+                for player in remote:
+                    await player.connection.send(b'R', RESULT, table_index, player.seat, hand, player.money,
+                                                 player in winners)
+            for connection in {player.connection for player in remote}:
+                await connection.send(b'E', END, table_index)
+        except BaseException:
+            self.finished.set() # for serve to raise the error rather than wait on a table that will never finish
+            raise
+        self.tables_finished += 1
+        if self.tables_finished == self.num_tables:
+            self.finished.set()
+
+    async def serve(self, host='127.0.0.1', port=0, unix_path=None):
+        """ Listen until every table has played its hands; returns the tables."""
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle, unix_path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        self.server = server
+        async with server:
+            await self.finished.wait()
+        try:
+            await asyncio.gather(*self.games)
+        except BaseException:
+            # a table failed: the agents still waiting on it see their connections end
+            for connection in self.connections:
+                connection.writer.close()
+            raise
+        finally:
+            for game in self.games:
+                game.cancel()
+        return self.tables
+
+async def run_agent(connect, name, num_seats, decide):
+    """ Play num_seats seats until all their tables finish.
+
+    Args:
+        connect: coroutine function returning (reader, writer), e.g. functools.partial(asyncio.open_connection, host, port)
+        name: the agent's name
+        num_seats: number of seats to ask for
+        decide: function of (kind, table, seat, hand, hole, board, money, highest_bet, recent_bet), where kind
+            is 'bet' or 'match', returning (yes, amount)
+
+    Returns:
+        dict of (table, seat) to the seat's money after each hand
+    """
+    reader, writer = await connect()
+    encoded = name.encode()
+    writer.write(b'H' + HELLO.pack(num_seats, len(encoded)) + encoded)
+    await writer.drain()
+    money, tables, ended = {}, set(), 0
+    try:
+        while not tables or ended < len(tables):
+            kind = await reader.readexactly(1)
+            if kind == b'S':
+                table_index, seat = SEAT.unpack(await reader.readexactly(SEAT.size))
+                tables.add(table_index)
+                money[table_index, seat] = []
+            elif kind in (b'B', b'M'):
+                request, table_index, seat, hand, *fields = DECIDE.unpack(await reader.readexactly(DECIDE.size))
+                hole, board = fields[:2], [id for id in fields[2:7] if id >= 0]
+                yes, amount = decide('bet' if kind == b'B' else 'match', table_index, seat, hand, hole, board, *fields[7:])
+                writer.write(b'A' + ANSWER.pack(request, bool(yes), amount or 0.0))
+                await writer.drain()
+            elif kind == b'R':
+                table_index, seat, hand, seat_money, won = RESULT.unpack(await reader.readexactly(RESULT.size))
+                money[table_index, seat].append(seat_money)
+            elif kind == b'E':
+                await reader.readexactly(END.size)
+                ended += 1
+            else:
+                raise ProtocolError(f"unexpected message {kind!r}")
+    finally:
+        writer.close()
+    return money
+
+def cautious_agent(kind, table_index, seat, hand, hole, board, money, highest_bet, recent_bet):
+    """ Bets a tenth of its money when that is enough, and matches small raises."""
+    if kind == 'bet':
+        return money / 10 >= highest_bet, money / 10
+    return highest_bet - recent_bet < money / 5, 0.0
+
+
+def test_play_hand_as_table_does():
+    for streets in (False, True):
+        tables = [Table([AutomaticPlayer(f"Bot {i}", 100) for i in range(4)], seed=3) for _ in range(2)]
+        for _ in range(20):
+            winners = tables[0].play_streets() if streets else tables[0].play_hand()
+            assert [player.name for player in asyncio.run(play_hand(tables[1], streets))] == \
+                [player.name for player in winners]
+        assert [player.money for player in tables[0].players_dict.values()] == \
+            [player.money for player in tables[1].players_dict.values()]
+
+def test_host_and_agents(tmp_path):
+    from functools import partial
+    path = str(tmp_path / 'poker.sock')
+
+    async def main():
+        host = GameHost(num_tables=6, seats_per_table=4, remote_seats=2, num_hands=5, decision_timeout=0.5,
+                        bot_class=AutomaticPlayer)
+        serving = asyncio.create_task(host.serve(unix_path=path))
+        while not hasattr(host, 'server'):
+            await asyncio.sleep(0.01)
+        connect = partial(asyncio.open_unix_connection, path)
+        results = await asyncio.gather(run_agent(connect, 'first', 6, agent),
+                                       run_agent(connect, 'second', 6, agent))
+        return await serving, results
+
+    recent_bets = {'bet': set(), 'match': set()}
+
+    def agent(kind, *args):
+        recent_bets[kind].add(args[-1])
+        return cautious_agent(kind, *args)
+
+    tables, results = asyncio.run(main())
+    assert recent_bets['bet'] == {0.0} and len(recent_bets['match']) > 1
+    assert len(tables) == 6 and sorted(len(result) for result in results) == [6, 6]
+    assert all(len(money) == 5 for result in results for money in result.values())
+    for table in tables.values():
+        assert abs(sum(player.money for player in table.players_dict.values()) - 400) < 1e-6
+
+def test_slow_agent_times_out(tmp_path):
+    from functools import partial
+    import time
+
+    async def main():
+        host = GameHost(num_tables=3, seats_per_table=3, remote_seats=1, num_hands=3, decision_timeout=0.05)
+        serving = asyncio.create_task(host.serve(port=0))
+        while not hasattr(host, 'server'):
+            await asyncio.sleep(0.01)
+        port = host.server.sockets[0].getsockname()[1]
+        connect = partial(asyncio.open_connection, '127.0.0.1', port)
+
+        def slow(*args):
+            time.sleep(0.2)
+            return cautious_agent(*args)
+
+        # the agent gets a thread and loop of its own, as if it were another process
+        await asyncio.to_thread(asyncio.run, run_agent(connect, 'slow', 3, slow))
+        return await serving
+
+    start = time.perf_counter()
+    tables = asyncio.run(main())
+    assert sum(player.timeouts for table in tables.values() for player in table.players_dict.values()
+               if isinstance(player, RemotePlayer)) > 0
+    assert time.perf_counter() - start < 10
+
+def test_agent_disconnects(tmp_path):
+    from functools import partial
+    path = str(tmp_path / 'poker.sock')
+
+    async def main():
+        host = GameHost(num_tables=4, seats_per_table=3, remote_seats=1, num_hands=5, streets=True)
+        serving = asyncio.create_task(host.serve(unix_path=path))
+        while not hasattr(host, 'server'):
+            await asyncio.sleep(0.01)
+        # an agent that answers its first two requests and then goes away
+        reader, writer = await asyncio.open_unix_connection(path)
+        writer.write(b'H' + HELLO.pack(2, 4) + b'gone')
+        answered = 0
+        while answered < 2:
+            kind = await reader.readexactly(1)
+            if kind == b'S':
+                await reader.readexactly(SEAT.size)
+            elif kind in (b'B', b'M'):
+                request = DECIDE.unpack(await reader.readexactly(DECIDE.size))[0]
+                writer.write(b'A' + ANSWER.pack(request, True, 1.0))
+                answered += 1
+            else:
+                await reader.readexactly(RESULT.size)
+        writer.close()
+        others = run_agent(partial(asyncio.open_unix_connection, path), 'stays', 2, cautious_agent)
+        return await asyncio.wait_for(asyncio.gather(serving, others), 10)
+
+    tables, results = asyncio.run(main())
+    assert len(tables) == 4 and all(len(money) == 5 for money in results.values())
+    for table in tables.values():
+        assert abs(sum(player.money for player in table.players_dict.values()) - 300) < 1e-6
+
+def test_every_seat_folds(tmp_path):
+    from functools import partial
+    path = str(tmp_path / 'poker.sock')
+
+    async def main():
+        host = GameHost(num_tables=1, seats_per_table=2, remote_seats=2, num_hands=2, decision_timeout=0.05)
+        serving = asyncio.create_task(host.serve(unix_path=path))
+        while not hasattr(host, 'server'):
+            await asyncio.sleep(0.01)
+        never = lambda *args: (False, 0.0)
+        agent = run_agent(partial(asyncio.open_unix_connection, path), 'never', 2, never)
+        return await asyncio.wait_for(asyncio.gather(serving, agent), 10)
+
+    tables, money = asyncio.run(main())
+    assert all(len(hands) == 2 for hands in money.values())
+    assert sum(player.money for player in tables[0].players_dict.values()) == 200
+
+def test_table_failure_raises():
+    from functools import partial
+
+    class Broken(Player):
+        def place_bet(self, table_cards, max_bet_so_far):
+            raise ValueError("broken bot")
+
+    async def main():
+        host = GameHost(num_tables=2, seats_per_table=3, remote_seats=1, num_hands=3, bot_class=Broken)
+        serving = asyncio.create_task(host.serve(port=0))
+        while not hasattr(host, 'server'):
+            await asyncio.sleep(0.01)
+        port = host.server.sockets[0].getsockname()[1]
+        agent = asyncio.create_task(run_agent(partial(asyncio.open_connection, '127.0.0.1', port), 'a', 2,
+                                              cautious_agent))
+        try:
+            await asyncio.wait_for(serving, 10)
+        finally:
+            agent.cancel()
+
+    try:
+        asyncio.run(main())
+        assert False, "a table that fails should make serve raise"
+    except ValueError:
+        pass
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tables', type=int, default=100)
+    parser.add_argument('--seats', type=int, default=4, help='seats per table')
+    parser.add_argument('--remote-seats', type=int, default=1, help='seats per table played by agents')
+    parser.add_argument('--hands', type=int, default=100, help='hands each table plays')
+    parser.add_argument('--timeout', type=float, default=1.0, help='seconds an agent has to decide')
+    parser.add_argument('--streets', action='store_true', help='bet before the flop and on every street')
+    parser.add_argument('--port', type=int, default=9999)
+    parser.add_argument('--unix', default=None, help='listen on this Unix socket instead of TCP')
+    args = parser.parse_args(argv)
+    host = GameHost(args.tables, args.seats, args.remote_seats, args.hands, decision_timeout=args.timeout,
+                    streets=args.streets)
+    tables = asyncio.run(host.serve(port=args.port, unix_path=args.unix))
+    for table_index, table in sorted(tables.items()):
+        print(table_index, {player.name: round(player.money, 2) for player in table.players_dict.values()})
+
+if __name__ == "__main__":
+    main()
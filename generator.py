@@ -1,6 +1,8 @@
 from cards import Card, suits
-from evaluator import evaluation
+from evaluator import evaluation, evaluate_batch
+from itertools import combinations, product
 import random
+import numpy as np
 
 values = {
     'high card': 0,
@@ -15,30 +17,26 @@ values = {
     'royal flush': 9
 }
 
-def generate_high_card():
-    while True:
-        # Select 5 unique values from 2 to 14 (Ace as 14)
-        chosen_values = random.sample(range(2, 15), 5)
-
-        # Sort the values to easily check for a straight
-        chosen_values.sort()
-
-        # Check if the values form a straight
-        if any(chosen_values[i] + 1 == chosen_values[i + 1] for i in range(4)):
-            continue  # If the values form a straight, regenerate
+# The hands the generators below draw from, in ascending order of value:
+# value sets without two consecutive values, value sets that are not a
+# straight (counting A-2-3-4-5), and suit indices that are not all the same
+_high_card_value_sets = [hand for hand in combinations(range(2, 15), 5)
+                         if not any(hand[i] + 1 == hand[i + 1] for i in range(4))]
+_flush_value_sets = [hand for hand in combinations(range(2, 15), 5)
+                     if not all(hand[i] + 1 == hand[i + 1] for i in range(4)) and set(hand) != {14, 2, 3, 4, 5}]
+_mixed_suit_patterns = [hand_suits for hand_suits in product(range(4), repeat=5) if len(set(hand_suits)) > 1]
 
-        # Randomly select 5 suits, allowing duplicates (since multiple cards can have the same suit)
-        chosen_suits = random.choices(suits, k=5)
-
-        # Check if all suits are the same (flush condition)
-        if len(set(chosen_suits)) == 1:
-            continue  # If all suits are the same (flush), regenerate
+def generate_high_card():
+    # 5 values with no two consecutive, and suits that are not all the same:
+    # drawn straight from the lists of what used to be accepted by retrying
+    chosen_values = random.choice(_high_card_value_sets)
+    chosen_suits = random.choice(_mixed_suit_patterns)
 
-        # Create the hand of cards using the chosen values and suits
-        cards = [Card(suit, value) for suit, value in zip(chosen_suits, chosen_values)]
+    # Create the hand of cards using the chosen values and suits
+    cards = [Card(suits[suit], value) for suit, value in zip(chosen_suits, chosen_values)]
 
-        # Return the hand of cards as a high card
-        return cards
+    # Return the hand of cards as a high card
+    return cards
 
 def generate_pair():
     pair_value = random.randint(2, 14)
@@ -81,52 +79,34 @@ def generate_three_of_a_kind():
     return cards
 
 def generate_straight():
-    while True:
-        # Start with a random starting point for the straight
-        start_value = random.randint(2, 10)  # Values from 2 to 10 so we can have a full 5-card straight
-        if start_value == 10:  # Handle Ace-high straight (10, J, Q, K, A)
-            values = [10, 11, 12, 13, 14]
-        else:
-            values = [start_value + i for i in range(5)]  # Generate a straight sequence
-
-        # Randomly choose 5 suits, allowing duplicates
-        suits_for_straight = random.choices(suits, k=5)
+    # Start with a random starting point for the straight
+    start_value = random.randint(2, 10)  # Values from 2 to 10 so we can have a full 5-card straight
+    if start_value == 10:  # Handle Ace-high straight (10, J, Q, K, A)
+        values = [10, 11, 12, 13, 14]
+    else:
+        values = [start_value + i for i in range(5)]  # Generate a straight sequence
 
-        # Check if the hand is a flush (all suits are the same)
-        if len(set(suits_for_straight)) == 1:
-            continue  # If it's a flush (straight flush), regenerate
+    # Randomly choose 5 suits, allowing duplicates but not all the same (a straight flush)
+    suits_for_straight = random.choice(_mixed_suit_patterns)
 
-        # Create the hand using the chosen values and suits
-        cards = [Card(suit, value) for suit, value in zip(suits_for_straight, values)]
+    # Create the hand using the chosen values and suits
+    cards = [Card(suits[suit], value) for suit, value in zip(suits_for_straight, values)]
 
-        return cards
+    return cards
 
 def generate_flush():
-    while True:
-        # Randomly select a suit for the flush
-        suit = random.choice(suits)
-
-        # Randomly select 5 values from 2 to 14
-        chosen_values = random.sample(range(2, 15), 5)
-
-        # Check if this flush is actually a royal flush
-        if set(chosen_values) == {10, 11, 12, 13, 14}:  # Royal flush check
-            continue  # If it's a royal flush, regenerate
-
-        # Check if this flush is actually a low straight flush
-        if set(chosen_values) == {14, 2, 3, 4, 5}:
-            continue  # regenerate
+    # Randomly select a suit for the flush
+    suit = random.choice(suits)
 
-        # Check if the flush is a straight flush
-        chosen_values.sort()  # Sort the values to check for a straight
-        if all(chosen_values[i] + 1 == chosen_values[i + 1] for i in range(4)):  # Check for consecutive values
-            continue  # If it's a straight flush, regenerate
+    # Randomly select 5 values from 2 to 14, sorted, that are not a straight
+    # (which would make a straight or royal flush)
+    chosen_values = random.choice(_flush_value_sets)
 
-        # Create the flush hand
-        cards = [Card(suit, value) for value in chosen_values]
+    # Create the flush hand
+    cards = [Card(suit, value) for value in chosen_values]
 
-        # Return the flush hand
-        return cards
+    # Return the flush hand
+    return cards
 
 def generate_full_house():
     triplet_value = random.randint(2, 14)
@@ -185,6 +165,109 @@ def generate_royal_flush():
     return cards
 
 
+# Batch versions of the generators above: each draws n hands at once as an
+# (n, 5) array of card ids, with the same distribution over cards and card
+# order as calling the single-hand function n times.  For every hand of a
+# category, uniformly, see hand_index.
+
+_high_card_values = np.array(_high_card_value_sets)
+_flush_values = np.array(_flush_value_sets)
+_mixed_suits = np.array(_mixed_suit_patterns)
+
+def _rng(rng):
+    return rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng)
+
+def _ids(hand_values, hand_suits):
+    return (4 * (hand_values - 2) + hand_suits).astype(np.int8)
+
+def _ordered_samples(rng, n, size, population=13, excluded=None):
+    """ size distinct draws, in random order, from range(population) for each of n rows, avoiding excluded."""
+    keys = rng.random((n, population))
+    if excluded is not None:
+        for column in np.atleast_2d(excluded.T):
+            keys[np.arange(n), column] = 2 # sorts after every real key
+    return np.argsort(keys, axis=1)[:, :size]
+
+def generate_high_cards(n, rng=None):
+    rng = _rng(rng)
+    return _ids(_high_card_values[rng.integers(len(_high_card_values), size=n)],
+                _mixed_suits[rng.integers(len(_mixed_suits), size=n)])
+
+def generate_pairs(n, rng=None):
+    rng = _rng(rng)
+    pair_value = rng.integers(2, 15, size=n)
+    pair_suits = _ordered_samples(rng, n, 2, 4)
+    other_values = _ordered_samples(rng, n, 3, excluded=pair_value - 2) + 2
+    other_suits = _ordered_samples(rng, n, 3, 4)
+    return _ids(np.column_stack([pair_value, pair_value, other_values]), np.column_stack([pair_suits, other_suits]))
+
+def generate_two_pairs(n, rng=None):
+    rng = _rng(rng)
+    pair_values = _ordered_samples(rng, n, 2) + 2
+    pair_suits = np.column_stack([_ordered_samples(rng, n, 2, 4), _ordered_samples(rng, n, 2, 4)])
+    kicker_value = _ordered_samples(rng, n, 1, excluded=pair_values - 2) + 2
+    kicker_suit = rng.integers(4, size=(n, 1))
+    hand_values = np.column_stack([pair_values[:, [0, 0, 1, 1]], kicker_value])
+    return _ids(hand_values, np.column_stack([pair_suits, kicker_suit]))
+
+def generate_three_of_a_kinds(n, rng=None):
+    rng = _rng(rng)
+    triplet_value = rng.integers(2, 15, size=n)
+    triplet_suits = _ordered_samples(rng, n, 3, 4)
+    other_values = _ordered_samples(rng, n, 2, excluded=triplet_value - 2) + 2
+    other_suits = _ordered_samples(rng, n, 2, 4)
+    hand_values = np.column_stack([np.repeat(triplet_value[:, None], 3, axis=1), other_values])
+    return _ids(hand_values, np.column_stack([triplet_suits, other_suits]))
+
+def generate_straights(n, rng=None):
+    rng = _rng(rng)
+    start_value = rng.integers(2, 11, size=(n, 1))
+    return _ids(start_value + np.arange(5), _mixed_suits[rng.integers(len(_mixed_suits), size=n)])
+
+def generate_flushes(n, rng=None):
+    rng = _rng(rng)
+    suit = rng.integers(4, size=(n, 1))
+    return _ids(_flush_values[rng.integers(len(_flush_values), size=n)], suit)
+
+def generate_full_houses(n, rng=None):
+    rng = _rng(rng)
+    triplet_value = rng.integers(2, 15, size=n)
+    pair_value = _ordered_samples(rng, n, 1, excluded=triplet_value - 2) + 2
+    hand_values = np.column_stack([np.repeat(triplet_value[:, None], 3, axis=1), pair_value, pair_value])
+    return _ids(hand_values, np.column_stack([_ordered_samples(rng, n, 3, 4), _ordered_samples(rng, n, 2, 4)]))
+
+def generate_four_of_a_kinds(n, rng=None):
+    rng = _rng(rng)
+    quad_value = rng.integers(2, 15, size=n)
+    kicker_value = _ordered_samples(rng, n, 1, excluded=quad_value - 2) + 2
+    hand_values = np.column_stack([np.repeat(quad_value[:, None], 4, axis=1), kicker_value])
+    return _ids(hand_values, np.column_stack([_ordered_samples(rng, n, 4, 4), rng.integers(4, size=(n, 1))]))
+
+def generate_straight_flushes(n, rng=None):
+    rng = _rng(rng)
+    upper_value = rng.integers(5, 14, size=(n, 1))
+    hand_values = upper_value - np.arange(5)
+    hand_values[hand_values == 1] = 14 # 5, 4, 3, 2, A
+    return _ids(hand_values, rng.integers(4, size=(n, 1)))
+
+def generate_royal_flushes(n, rng=None):
+    rng = _rng(rng)
+    return _ids(np.tile(np.arange(14, 9, -1), (n, 1)), rng.integers(4, size=(n, 1)))
+
+batch_generators = {
+    'high card': (generate_high_card, generate_high_cards),
+    'pair': (generate_pair, generate_pairs),
+    'two pair': (generate_two_pair, generate_two_pairs),
+    'three of a kind': (generate_three_of_a_kind, generate_three_of_a_kinds),
+    'straight': (generate_straight, generate_straights),
+    'flush': (generate_flush, generate_flushes),
+    'full house': (generate_full_house, generate_full_houses),
+    'four of a kind': (generate_four_of_a_kind, generate_four_of_a_kinds),
+    'straight flush': (generate_straight_flush, generate_straight_flushes),
+    'royal flush': (generate_royal_flush, generate_royal_flushes),
+}
+
+
 def test_high_card():
     hand = generate_high_card()
     assert evaluation(hand)[0] == values['high card']
@@ -225,6 +308,26 @@ def test_straight_flush():
     straight_flush = generate_straight_flush()
     assert evaluation(straight_flush)[0] == values['straight flush']
 
+def test_batch_categories():
+    for name, (_, generate_batch) in batch_generators.items():
+        hands = generate_batch(1000, rng=0)
+        assert hands.shape == (1000, 5)
+        assert all(len(set(hand)) == 5 for hand in hands.tolist())
+        assert (evaluate_batch(hands)[1] == values[name]).all()
+
+def test_batch_distributions():
+    # each card position should hold the same values and suits as often as from the single-hand generator
+    random.seed(0)
+    num_hands = 3000
+    for name, (generate, generate_batch) in batch_generators.items():
+        single = np.array([[card.id for card in generate()] for _ in range(num_hands)])
+        batch = generate_batch(num_hands, rng=0)
+        for position in range(5):
+            for part in [lambda ids: ids // 4 + 2, lambda ids: ids % 4]:
+                counts = np.bincount(part(single[:, position]), minlength=15) / num_hands
+                batch_counts = np.bincount(part(batch[:, position]), minlength=15) / num_hands
+                assert np.abs(counts - batch_counts).max() < 0.05, (name, position)
+
 
 if __name__ == "__main__":
     num_tests = 10000
@@ -238,4 +341,6 @@ if __name__ == "__main__":
         test_full_house()
         test_four_of_a_kind()
         test_royal_flush()
-        test_straight_flush()
\ No newline at end of file
+        test_straight_flush()
+    test_batch_categories()
+    test_batch_distributions()
@@ -0,0 +1,234 @@
+from cards import cards_by_id
+from player import Player
+import os
+import struct
+import numpy as np
+
+# An append-only log of played hands: a header of magic, format version and
+# number of seats, then one fixed-width little-endian record per hand.
+# Seats number the players in the order they joined the table; per seat a
+# record holds
+#   hole, money          - hole card ids, money at the start of the hand
+# per betting round, one for Table.play_hand and up to MAX_ROUNDS for Table.play_streets,
+#   shown                - how many board cards were face up, -1 for rounds not played
+#   bets, matches        - amounts each seat put in by take_bets and get_matches
+#   betted, matched      - bitmasks of the seats that bet and matched, bit i for seat i
+# and per hand
+#   hand                 - hand number in the file
+#   order                - seats in betting order, -1 past the last
+#   board                - board card ids, -1 for cards not dealt when the hand ended
+#   winners              - bitmask of the seats that shared the pot
+#   pot                  - the pot given to the winners
+# Amounts are float64, so a hand replays to exactly the recorded money.
+
+MAGIC = b'PKHH'
+FORMAT_VERSION = 2
+MAX_ROUNDS = 4 # before the flop and after the flop, the turn and the river
+HEADER = struct.Struct('<4sHH8x')
+
+class HandHistoryError(Exception):
+    pass
+
+def record_dtype(num_seats):
+    return np.dtype([
+        ('hand', '<u4'), ('order', 'i1', (num_seats,)), ('hole', 'i1', (num_seats, 2)), ('board', 'i1', (5,)),
+        ('shown', 'i1', (MAX_ROUNDS,)), ('betted', '<u2', (MAX_ROUNDS,)), ('matched', '<u2', (MAX_ROUNDS,)),
+        ('winners', '<u2'), ('money', '<f8', (num_seats,)), ('bets', '<f8', (MAX_ROUNDS, num_seats)),
+        ('matches', '<f8', (MAX_ROUNDS, num_seats)), ('pot', '<f8'),
+    ])
+
+def _read_header(f, path):
+    magic, version, num_seats = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise HandHistoryError(f"{path} is not a version {FORMAT_VERSION} hand history")
+    return num_seats
+
+class HandHistoryWriter:
+    """ Appends hands to a hand history file, buffer_size records at a time.
+
+    Pass one to Table (or Environment) as history to record every hand it plays.
+    """
+    def __init__(self, path, num_seats, buffer_size=4096):
+        assert 1 <= num_seats <= 16 # seats are bits of a uint16
+        self.path = path
+        self.num_seats = num_seats
+        self.dtype = record_dtype(num_seats)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                if _read_header(f, path) != num_seats:
+                    raise HandHistoryError(f"{path} records hands of a different number of seats")
+            self.hands = (os.path.getsize(path) - HEADER.size) // self.dtype.itemsize
+            self.file = open(path, 'ab')
+        else:
+            self.hands = 0
+            self.file = open(path, 'wb')
+            self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, num_seats))
+        self.buffer = np.zeros(buffer_size, dtype=self.dtype)
+        self.buffered = 0
+
+    def new_record(self):
+        """ The next record, blanked, for the caller to fill in and then commit."""
+        record = self.buffer[self.buffered]
+        record.fill(0)
+        record['order'] = -1
+        record['board'] = -1
+        record['shown'] = -1
+        record['hand'] = self.hands
+        return record
+
+    def commit(self):
+        self.buffered += 1
+        self.hands += 1
+        if self.buffered == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer[:self.buffered].tobytes())
+        self.file.flush()
+        self.buffered = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class HandHistory:
+    """ A hand history file, memory-mapped, with each field as a column: history['board'] is (hands, 5)."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.num_seats = _read_header(f, path)
+        self.dtype = record_dtype(self.num_seats)
+        num_hands = (os.path.getsize(path) - HEADER.size) // self.dtype.itemsize
+        self.records = np.memmap(path, dtype=self.dtype, mode='r', offset=HEADER.size, shape=(num_hands,)) \
+            if num_hands else np.zeros(0, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, field):
+        return self.records[field]
+
+    def seats(self, mask):
+        """ The seats set in a betted, matched or winners bitmask."""
+        return [seat for seat in range(self.num_seats) if mask >> seat & 1]
+
+class ReplayPlayer(Player):
+    """ Bets and matches as a recorded hand says this seat did, in each round of betting."""
+    def __init__(self, name, money, bets, matches):
+        super().__init__(name, money)
+        self.bets = bets # (bet, amount) per round
+        self.matches = matches # (match, amount) per round
+
+    def place_bet(self, table_cards, max_bet_so_far):
+        return self.bets[self.table.betting_round]
+
+    def match(self, table_cards, high_bet):
+        return self.matches[self.table.betting_round]
+
+def replay(history: HandHistory, index: int, verbose=1):
+    """ Play recorded hand number index, from Table.play_hand or Table.play_streets, through Table again.
+
+    Returns the Table, whose players end the hand with what they had after it was recorded.
+    """
+    from table import Table
+    record = history.records[index]
+    players = []
+    for seat in range(history.num_seats):
+        bets = [(True, amount) if betted >> seat & 1 else (False, None)
+                for betted, amount in zip(record['betted'].tolist(), record['bets'][:, seat].tolist())]
+        matches = [(True, amount) if matched >> seat & 1 else (False, None)
+                   for matched, amount in zip(record['matched'].tolist(), record['matches'][:, seat].tolist())]
+        players.append(ReplayPlayer(f"Seat {seat}", float(record['money'][seat]), bets, matches))
+    for player, hole in zip(players, record['hole'].tolist()):
+        player.cards = [cards_by_id[id] for id in hole]
+    table = Table(players, verbose=verbose)
+    table.rotation_order = [players[seat] for seat in record['order'].tolist() if seat >= 0]
+    table.players_list = table.rotation_order[:]
+    board = [cards_by_id[id] for id in record['board'].tolist() if id >= 0]
+    if verbose >= 1:
+        for player in table.players_list:
+            print(f'{player.name}: {[str(card) for card in player.cards]}')
+    for shown in record['shown'].tolist():
+        if shown < 0:
+            break
+        table.face_up_cards = board[:shown]
+        table.hand_states = {} # worked out again from the cards now face up
+        if verbose >= 1:
+            table.print_face_up()
+        table.take_bets()
+        table.get_matches()
+        if len(table.players_list) == 1:
+            break
+    table.give_money_to_winner()
+    return table
+
+
+def _record_games(path, num_hands, seed, streets=False):
+    from table import Table
+    from player import AutomaticPlayer, RandomPlayer
+    import random
+    random.seed(seed)
+    players = [RandomPlayer("Bot 1", 100), RandomPlayer("Bot 2", 100), AutomaticPlayer("Louis", 100)]
+    with HandHistoryWriter(path, len(players), buffer_size=7) as history:
+        table = Table(players, seed=seed, history=history)
+        for _ in range(num_hands):
+            if streets:
+                table.play_streets()
+            else:
+                table.play_hand()
+    return players
+
+def test_record_and_read(tmp_path):
+    path = str(tmp_path / 'hands.bin')
+    players = _record_games(path, 20, seed=1)
+    _record_games(path, 5, seed=2) # appends
+    history = HandHistory(path)
+    assert len(history) == 25 and list(history['hand']) == list(range(25))
+    assert history['hole'].shape == (25, 3, 2) and history['order'].shape == (25, 3)
+    hands = np.concatenate([history['hole'].reshape(25, -1), history['board']], axis=1)
+    assert all(len(set(hand)) == 11 for hand in hands.tolist())
+    # money is conserved from one hand to the next
+    after = history['money'] - history['bets'].sum(axis=1) - history['matches'].sum(axis=1)
+    for hand in range(20):
+        for seat in history.seats(int(history['winners'][hand])):
+            after[hand, seat] += history['pot'][hand] / bin(int(history['winners'][hand])).count('1')
+    assert np.allclose(after[:19], history['money'][1:20])
+    assert np.allclose(after[19], [player.money for player in players])
+    assert (history['shown'] == [5, -1, -1, -1]).all() # play_hand bets once, on the whole board
+
+def test_replay(tmp_path):
+    path = str(tmp_path / 'hands.bin')
+    _record_games(path, 10, seed=3)
+    history = HandHistory(path)
+    for index in range(9):
+        table = replay(history, index, verbose=0)
+        assert [player.money for player in table.players_dict.values()] == history['money'][index + 1].tolist()
+
+def test_replay_streets(tmp_path):
+    path = str(tmp_path / 'hands.bin')
+    _record_games(path, 30, seed=4, streets=True)
+    history = HandHistory(path)
+    rounds = (history['shown'] >= 0).sum(axis=1)
+    assert set(rounds.tolist()) > {1, 4} # some hands end before the river
+    assert all(history['shown'][hand, :rounds[hand]].tolist() == [0, 3, 4, 5][:rounds[hand]] for hand in range(30))
+    for index in range(29):
+        table = replay(history, index, verbose=0)
+        assert len(table.face_up_cards) == (history['board'][index] >= 0).sum()
+        assert [player.money for player in table.players_dict.values()] == history['money'][index + 1].tolist()
+
+if __name__ == "__main__":
+    import sys
+    history = HandHistory(sys.argv[1])
+    print(f"{len(history)} hands of {history.num_seats} seats")
+    for index in map(int, sys.argv[2:]):
+        print("*" * 40)
+        table = replay(history, index)
+        for player in table.players_dict.values():
+            print(f"{player.name} has {player.money}")
@@ -0,0 +1,238 @@
+from evaluator import values, hand_category, best_strength
+from itertools import combinations, product
+from collections import Counter
+import numpy as np
+
+# A numbering of the hands in each category: index i in range(category_counts[name])
+# names exactly one 5-card hand, so a uniformly random hand of any category
+# is one random integer and an unrank, with no rejection.
+#
+# Each category's index is split into mixed-radix digits, one per choice that
+# makes the hand (e.g. for a pair: the pair's rank, its two suits, the three
+# kicker ranks and their suits), and each digit picks from a fixed table.
+# Ranks run 0 (two) to 12 (ace) and a card's id is 4 * rank + suit.
+
+_straights = np.array([sorted([12, 0, 1, 2, 3])] + [list(range(low, low + 5)) for low in range(9)])
+_no_straights = np.array([hand for hand in combinations(range(13), 5) if sorted(hand) not in _straights.tolist()])
+_mixed_suits = np.array([hand for hand in product(range(4), repeat=5) if len(set(hand)) > 1])
+_suit_pairs = np.array(list(combinations(range(4), 2)))
+_suit_triples = np.array(list(combinations(range(4), 3)))
+_rank_pairs = np.array(list(combinations(range(13), 2)))
+_kicker_pairs = np.array(list(combinations(range(12), 2)))
+_kicker_triples = np.array(list(combinations(range(12), 3)))
+
+def _lookup(table):
+    return {tuple(row): index for index, row in enumerate(table.tolist())}
+
+_no_straights_index = _lookup(_no_straights)
+_mixed_suits_index = _lookup(_mixed_suits)
+_suit_pairs_index = _lookup(_suit_pairs)
+_suit_triples_index = _lookup(_suit_triples)
+_rank_pairs_index = _lookup(_rank_pairs)
+_kicker_pairs_index = _lookup(_kicker_pairs)
+_kicker_triples_index = _lookup(_kicker_triples)
+
+# the number of values each digit takes, most significant first
+_radices = {
+    'high card': [len(_no_straights), len(_mixed_suits)],
+    'pair': [13, 6, 220, 64],
+    'two pair': [78, 6, 6, 11, 4],
+    'three of a kind': [13, 4, 66, 16],
+    'straight': [10, len(_mixed_suits)],
+    'flush': [4, len(_no_straights)],
+    'full house': [13, 4, 12, 6],
+    'four of a kind': [13, 12, 4],
+    'straight flush': [4, 9],
+    'royal flush': [4],
+}
+category_counts = {name: int(np.prod(radices)) for name, radices in _radices.items()}
+category_weights = {name: count / sum(category_counts.values()) for name, count in category_counts.items()}
+
+def _digits(indices, radices):
+    digits = []
+    for radix in reversed(radices):
+        indices, digit = np.divmod(indices, radix)
+        digits.append(digit)
+    return digits[::-1]
+
+def _skip(slots, *excluded):
+    """ Ranks numbered among those left once the excluded ranks (in ascending order) are taken out, as plain ranks."""
+    ranks = slots.copy()
+    for rank in excluded:
+        ranks += ranks >= (rank[:, None] if ranks.ndim == 2 else rank)
+    return ranks
+
+def _unskip(ranks, *excluded):
+    return [rank - sum(rank > other for other in excluded) for rank in ranks]
+
+def _base4(digit, length):
+    return np.stack([digit // 4 ** (length - 1 - place) % 4 for place in range(length)], axis=1)
+
+def unrank(category: str, indices) -> np.ndarray:
+    """ The hands with these indices within the category, as an (N, 5) array of card ids.
+
+    A single index gives a single hand of shape (5,).
+    """
+    scalar = np.ndim(indices) == 0
+    indices = np.atleast_1d(np.asarray(indices, dtype=np.int64))
+    assert ((0 <= indices) & (indices < category_counts[category])).all()
+    digits = _digits(indices, _radices[category])
+    n = len(indices)
+
+    if category == 'high card':
+        ranks, suits = _no_straights[digits[0]], _mixed_suits[digits[1]]
+    elif category == 'pair':
+        pair, pair_suits, kickers, kicker_suits = digits
+        ranks = np.column_stack([pair, pair, _skip(_kicker_triples[kickers], pair)])
+        suits = np.column_stack([_suit_pairs[pair_suits], _base4(kicker_suits, 3)])
+    elif category == 'two pair':
+        pairs, low_suits, high_suits, kicker, kicker_suit = digits
+        low, high = _rank_pairs[pairs].T
+        ranks = np.column_stack([low, low, high, high, _skip(kicker, low, high)])
+        suits = np.column_stack([_suit_pairs[low_suits], _suit_pairs[high_suits], kicker_suit])
+    elif category == 'three of a kind':
+        three, three_suits, kickers, kicker_suits = digits
+        ranks = np.column_stack([three, three, three, _skip(_kicker_pairs[kickers], three)])
+        suits = np.column_stack([_suit_triples[three_suits], _base4(kicker_suits, 2)])
+    elif category == 'straight':
+        ranks, suits = _straights[digits[0]], _mixed_suits[digits[1]]
+    elif category == 'flush':
+        suit, hand = digits
+        ranks, suits = _no_straights[hand], np.repeat(suit[:, None], 5, axis=1)
+    elif category == 'full house':
+        three, three_suits, pair, pair_suits = digits
+        pair = _skip(pair, three)
+        ranks = np.column_stack([three, three, three, pair, pair])
+        suits = np.column_stack([_suit_triples[three_suits], _suit_pairs[pair_suits]])
+    elif category == 'four of a kind':
+        four, kicker, kicker_suit = digits
+        ranks = np.column_stack([four, four, four, four, _skip(kicker, four)])
+        suits = np.column_stack([np.tile(np.arange(4), (n, 1)), kicker_suit])
+    elif category == 'straight flush':
+        suit, straight = digits
+        ranks, suits = _straights[straight], np.repeat(suit[:, None], 5, axis=1)
+    else:
+        ranks, suits = np.tile(_straights[9], (n, 1)), np.repeat(digits[0][:, None], 5, axis=1)
+
+    hands = (4 * ranks + suits).astype(np.int8)
+    return hands[0] if scalar else hands
+
+def rank(hand_ids) -> tuple[str, int]:
+    """ The category of a 5-card hand, given by card ids, and its index within it."""
+    hand_ids = sorted(int(id) for id in hand_ids)
+    assert len(set(hand_ids)) == 5
+    category = {number: name for name, number in values.items()}[hand_category(best_strength(hand_ids))]
+    ranks = [id // 4 for id in hand_ids]
+    suits_of = {}
+    for id in hand_ids:
+        suits_of.setdefault(id // 4, []).append(id % 4)
+    by_count = sorted(Counter(ranks).items(), key=lambda item: (-item[1], item[0]))
+
+    def base4(suits):
+        return sum(suit * 4 ** (len(suits) - 1 - place) for place, suit in enumerate(suits))
+
+    if category in ('high card', 'straight'):
+        rank_digit = _no_straights_index[tuple(ranks)] if category == 'high card' else \
+            _straights.tolist().index(sorted(ranks))
+        digits = [rank_digit, _mixed_suits_index[tuple(id % 4 for id in hand_ids)]]
+    elif category == 'pair':
+        pair = by_count[0][0]
+        kickers = [rank for rank, _ in by_count[1:]]
+        digits = [pair, _suit_pairs_index[tuple(suits_of[pair])],
+                  _kicker_triples_index[tuple(_unskip(kickers, pair))], base4([suits_of[kicker][0] for kicker in kickers])]
+    elif category == 'two pair':
+        low, high = sorted(rank for rank, count in by_count if count == 2)
+        kicker = by_count[2][0]
+        digits = [_rank_pairs_index[(low, high)], _suit_pairs_index[tuple(suits_of[low])],
+                  _suit_pairs_index[tuple(suits_of[high])], _unskip([kicker], low, high)[0], suits_of[kicker][0]]
+    elif category == 'three of a kind':
+        three = by_count[0][0]
+        kickers = [rank for rank, _ in by_count[1:]]
+        digits = [three, _suit_triples_index[tuple(suits_of[three])],
+                  _kicker_pairs_index[tuple(_unskip(kickers, three))], base4([suits_of[kicker][0] for kicker in kickers])]
+    elif category == 'flush':
+        digits = [hand_ids[0] % 4, _no_straights_index[tuple(ranks)]]
+    elif category == 'full house':
+        three, pair = by_count[0][0], by_count[1][0]
+        digits = [three, _suit_triples_index[tuple(suits_of[three])], _unskip([pair], three)[0],
+                  _suit_pairs_index[tuple(suits_of[pair])]]
+    elif category == 'four of a kind':
+        four, kicker = by_count[0][0], by_count[1][0]
+        digits = [four, _unskip([kicker], four)[0], suits_of[kicker][0]]
+    elif category == 'straight flush':
+        digits = [hand_ids[0] % 4, _straights.tolist().index(sorted(ranks))]
+    else:
+        digits = [hand_ids[0] % 4]
+
+    index = 0
+    for digit, radix in zip(digits, _radices[category]):
+        index = index * radix + int(digit)
+    return category, index
+
+def sample(category: str, n: int, rng=None) -> np.ndarray:
+    """ n hands drawn uniformly from the category, as an (n, 5) array of card ids."""
+    rng = rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng)
+    return unrank(category, rng.integers(category_counts[category], size=n))
+
+def stratified_sample(n: int, rng=None, weights=None) -> tuple[np.ndarray, np.ndarray]:
+    """ n hands with each category's share fixed in advance rather than left to chance.
+
+    Args:
+        n: number of hands
+        rng: numpy Generator or seed
+        weights: dict of category name to weight; defaults to category_weights, how often each category is dealt
+
+    Returns:
+        (n, 5) array of card ids and (n,) array of their `values` categories, grouped by category
+    """
+    rng = rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng)
+    weights = category_weights if weights is None else weights
+    total = sum(weights.values())
+    shares = {name: n * weight / total for name, weight in weights.items()}
+    sizes = {name: int(share) for name, share in shares.items()}
+    # hand out what rounding down left over to the largest remainders
+    for name in sorted(shares, key=lambda name: sizes[name] - shares[name])[:n - sum(sizes.values())]:
+        sizes[name] += 1
+    hands = [sample(name, size, rng) for name, size in sizes.items() if size]
+    categories = [np.full(size, values[name], dtype=np.int8) for name, size in sizes.items() if size]
+    return np.concatenate(hands), np.concatenate(categories)
+
+def iterate(category: str, chunk_size=100_000):
+    """ Every hand in the category, in index order, as (chunk_size, 5) arrays of card ids."""
+    for start in range(0, category_counts[category], chunk_size):
+        yield unrank(category, np.arange(start, min(start + chunk_size, category_counts[category])))
+
+
+def test_category_counts():
+    assert category_counts == {
+        'high card': 1302540, 'pair': 1098240, 'two pair': 123552, 'three of a kind': 54912, 'straight': 10200,
+        'flush': 5108, 'full house': 3744, 'four of a kind': 624, 'straight flush': 36, 'royal flush': 4}
+    assert sum(category_counts.values()) == 2598960
+
+def test_rank_inverts_unrank():
+    rng = np.random.default_rng(0)
+    for name, count in category_counts.items():
+        indices = np.unique(np.concatenate([[0, count - 1], rng.integers(count, size=300)]))
+        hands = unrank(name, indices)
+        assert [rank(hand) for hand in hands] == [(name, index) for index in indices.tolist()]
+        assert (hands // 4 < 13).all() and all(len(set(hand)) == 5 for hand in hands.tolist())
+
+def test_small_categories_exhaustive():
+    from evaluator import evaluate_batch
+    for name in ['royal flush', 'straight flush', 'four of a kind', 'full house', 'flush', 'straight']:
+        hands = np.concatenate(list(iterate(name, chunk_size=1000)))
+        assert len({tuple(sorted(hand)) for hand in hands.tolist()}) == category_counts[name]
+        assert (evaluate_batch(hands)[1] == values[name]).all()
+
+def test_stratified_sample():
+    hands, categories = stratified_sample(1000, rng=1)
+    counts = np.bincount(categories, minlength=10)
+    assert counts.sum() == 1000 and counts[values['high card']] == 501 and counts[values['pair']] == 423
+    hands, categories = stratified_sample(100, rng=1, weights={name: 1 for name in category_counts})
+    assert (np.bincount(categories) == 10).all()
+
+if __name__ == "__main__":
+    test_category_counts()
+    test_rank_inverts_unrank()
+    test_small_categories_exhaustive()
+    test_stratified_sample()
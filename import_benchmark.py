@@ -0,0 +1,57 @@
+""" How long the game core takes to import, and whether it pulls in heavy dependencies.
+
+    python import_benchmark.py                 # time each module in a fresh interpreter
+    python import_benchmark.py --budget 0.5    # and fail if any takes longer than 0.5s
+
+Every module is imported in a new interpreter, as a worker process would,
+and the best of several runs is kept.  Exits with status 1 if a core module
+loads one of the heavy modules or goes over the budget.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+# what a worker that only plays the game needs
+core_modules = ['cards', 'evaluator', 'player', 'table', 'batch_table', 'environment']
+# loaded on first use only: torch by RL players and the environment's state, matplotlib by plotting, sklearn by learn_scores
+heavy_modules = ['torch', 'matplotlib', 'sklearn']
+
+_probe = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'heavy': sorted({heavy} & {{name.split('.')[0] for name in sys.modules}})}}))
+"""
+
+def import_time(module, repeats=3):
+    """ Best time in seconds to import module in a fresh interpreter, and the heavy modules it loaded."""
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', _probe.format(module=module, heavy=set(heavy_modules))],
+                                capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output))
+    return min(run['seconds'] for run in runs), runs[0]['heavy']
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--budget', type=float, default=None, help='most seconds any one module may take')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in core_modules:
+        seconds, heavy = import_time(module, args.repeats)
+        print(f"{module:15} {seconds * 1e3:8.1f}ms" + (f"  loads {', '.join(heavy)}" if heavy else ""))
+        if heavy or (args.budget is not None and seconds > args.budget):
+            failed = True
+    return 1 if failed else 0
+
+
+def test_core_imports_are_light():
+    for module in core_modules:
+        assert import_time(module, repeats=1)[1] == [], f"{module} loads a heavy dependency at import"
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+from functools import wraps
+import json
+import time
+import tracemalloc
+
+# Opt-in timers and counters for the game's hot paths.  Modules register the
+# methods worth timing with register(); enable() swaps each for a timed
+# wrapper and disable() puts the originals back, so while disabled the
+# methods are exactly as written and cost nothing extra.  The hot paths also
+# count events with count(), which is a check of one flag while disabled: the
+# table counts folds, showdowns, uncontested pots and hand states it had to
+# rebuild, and the environment the episodes it ends.
+#
+#   import instrumentation
+#   instrumentation.enable(flush_path='metrics.jsonl', trace_allocations=True)
+#   ... play ...
+#   print(instrumentation.snapshot())
+#   instrumentation.disable()
+
+_registered = [] # (class, method name, timer name)
+_originals = {} # (class, method name) -> the method as written
+_timers = {} # timer name -> [calls, total ns, max ns]
+_counters = {}
+_state = {'enabled': False, 'started': 0, 'flush_path': None, 'flush_interval': None, 'next_flush': 0,
+          'trace_allocations': False, 'top_allocations': 10, 'trace_fraction': 1.0, 'trace_period': 1.0,
+          'next_toggle': float('inf'), 'window_start': 0, 'allocations': None,
+          'next_event': 0} # the sooner of next_flush and next_toggle, the one time the timed methods check
+
+def register(cls, methods: dict):
+    """ Time these methods of cls, given as {method name: timer name}, while instrumentation is enabled."""
+    for method, name in methods.items():
+        _registered.append((cls, method, name))
+        if _state['enabled']:
+            _wrap(cls, method, name)
+
+def _wrap(cls, method, name):
+    original = cls.__dict__[method]
+    _originals[(cls, method)] = original
+    timer = _timers.setdefault(name, [0, 0, 0])
+    clock = time.perf_counter_ns
+
+    @wraps(original)
+    def timed(*args, **kwargs):
+        start = clock()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            end = clock()
+            elapsed = end - start
+            timer[0] += 1
+            timer[1] += elapsed
+            if elapsed > timer[2]:
+                timer[2] = elapsed
+            if end >= _state['next_event']:
+                _tick(end)
+    setattr(cls, method, timed)
+
+def enable(flush_path=None, flush_interval=10.0, trace_allocations=False, top_allocations=10,
+           trace_fraction=1.0, trace_period=1.0):
+    """ Start timing every registered method.
+
+    tracemalloc traces every allocation while it runs, which makes the game
+    several times slower, so allocations can be sampled instead: traced for
+    trace_fraction of every trace_period seconds, a snapshot then showing the
+    latest window.
+
+    Args:
+        flush_path: file to append a snapshot to, as a line of JSON, every flush_interval seconds
+        flush_interval: seconds between flushes
+        trace_allocations: also trace allocations with tracemalloc
+        top_allocations: how many of the busiest allocation sites a snapshot lists
+        trace_fraction: fraction of the time to trace allocations for, 1 for all of it
+        trace_period: seconds over which that fraction is taken
+    """
+    if _state['enabled']:
+        disable()
+    reset()
+    now = time.perf_counter_ns()
+    _state.update(enabled=True, started=now, flush_path=flush_path, flush_interval=flush_interval,
+                  trace_allocations=trace_allocations, top_allocations=top_allocations,
+                  trace_fraction=trace_fraction, trace_period=trace_period, next_toggle=float('inf'),
+                  next_flush=now + int(flush_interval * 1e9) if flush_path is not None else float('inf'))
+    if trace_allocations:
+        tracemalloc.start()
+        _state['window_start'] = now
+        if trace_fraction < 1:
+            _state['next_toggle'] = now + int(trace_fraction * trace_period * 1e9)
+    _state['next_event'] = min(_state['next_flush'], _state['next_toggle'])
+    for cls, method, name in _registered:
+        _wrap(cls, method, name)
+
+def disable():
+    """ Put the registered methods back as they were, flushing one last snapshot if flushing."""
+    if not _state['enabled']:
+        return
+    if _state['flush_path'] is not None:
+        _flush(time.perf_counter_ns())
+    for (cls, method), original in _originals.items():
+        setattr(cls, method, original)
+    _originals.clear()
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _state.update(enabled=False, next_flush=0, next_toggle=float('inf'), next_event=0)
+
+def reset():
+    """ Zero the timers and counters."""
+    for timer in _timers.values():
+        timer[:] = [0, 0, 0]
+    _counters.clear()
+    _state['allocations'] = None
+    if tracemalloc.is_tracing():
+        tracemalloc.clear_traces()
+
+def count(name, n=1):
+    """ Add n to a counter, if instrumentation is enabled."""
+    if _state['enabled']:
+        _counters[name] = _counters.get(name, 0) + n
+
+def snapshot() -> dict:
+    """ The timers, counters and, when tracing, memory and busiest allocation sites, so far."""
+    elapsed = (time.perf_counter_ns() - _state['started']) / 1e9 if _state['enabled'] else 0.0
+    result = {
+        'elapsed_s': elapsed,
+        'timers': {name: {'calls': calls, 'total_s': total / 1e9, 'mean_us': total / calls / 1e3 if calls else 0.0,
+                          'max_us': longest / 1e3}
+                   for name, (calls, total, longest) in _timers.items() if calls},
+        'counters': dict(_counters),
+    }
+    if tracemalloc.is_tracing():
+        result.update(_allocations())
+    elif _state['allocations'] is not None:
+        result.update(_state['allocations']) # from the last window traced
+    return result
+
+def _allocations():
+    current, peak = tracemalloc.get_traced_memory()
+    statistics = tracemalloc.take_snapshot().statistics('lineno')
+    statistics.sort(key=lambda statistic: statistic.count, reverse=True)
+    return {'memory': {'current_bytes': current, 'peak_bytes': peak},
+            'allocations': [{'where': f"{statistic.traceback[0].filename}:{statistic.traceback[0].lineno}",
+                             'blocks': statistic.count, 'bytes': statistic.size}
+                            for statistic in statistics[:_state['top_allocations']]]}
+
+def _tick(now):
+    if now >= _state['next_flush']:
+        _flush(now)
+    if now >= _state['next_toggle']:
+        _toggle_tracing(now)
+    _state['next_event'] = min(_state['next_flush'], _state['next_toggle'])
+
+def _toggle_tracing(now):
+    """ End the window of tracing allocations in progress, keeping what it saw, or start the next one."""
+    period = int(_state['trace_period'] * 1e9)
+    if tracemalloc.is_tracing():
+        _state['allocations'] = _allocations()
+        tracemalloc.stop()
+        _state['next_toggle'] = _state['window_start'] + period
+    else:
+        tracemalloc.start()
+        _state['window_start'] = now
+        _state['next_toggle'] = now + int(_state['trace_fraction'] * period)
+
+def _flush(now):
+    if _state['flush_path'] is None:
+        _state['next_flush'] = float('inf')
+        return
+    _state['next_flush'] = now + int(_state['flush_interval'] * 1e9)
+    with open(_state['flush_path'], 'a') as f:
+        f.write(json.dumps(snapshot()) + '\n')
+
+
+def test_enable_and_disable(tmp_path):
+    from table import Table
+    from player import AutomaticPlayer
+    take_bets = Table.take_bets
+    path = str(tmp_path / 'metrics.jsonl')
+    enable(flush_path=path, flush_interval=0.0)
+    try:
+        table = Table([AutomaticPlayer(f"Bot {i}", 100) for i in range(3)], seed=0)
+        for _ in range(5):
+            table.play_hand()
+        count('custom', 2)
+        metrics = snapshot()
+    finally:
+        disable()
+    assert Table.take_bets is take_bets # nothing left wrapped
+    assert metrics['timers']['play_hand']['calls'] == 5 and metrics['timers']['take_bets']['calls'] == 5
+    assert metrics['timers']['deal']['calls'] == 5 * (1 + 5) # the hole cards and each board card
+    assert metrics['timers']['best_hand']['calls'] >= 5 and metrics['counters']['custom'] == 2
+    counters = metrics['counters']
+    assert counters.get('showdowns', 0) + counters.get('uncontested', 0) == 5
+    with open(path) as f:
+        flushed = [json.loads(line) for line in f]
+    assert len(flushed) > 5 and flushed[-1]['timers']['play_hand']['calls'] == 5
+    count('ignored')
+    assert 'ignored' not in snapshot()['counters']
+
+def test_trace_allocations():
+    from table import Table
+    from player import RandomPlayer
+    enable(trace_allocations=True, top_allocations=3)
+    try:
+        table = Table([RandomPlayer(f"Bot {i}", 100) for i in range(3)], seed=0)
+        for _ in range(20):
+            table.play_streets()
+        metrics = snapshot()
+    finally:
+        disable()
+    assert metrics['memory']['peak_bytes'] > 0 and len(metrics['allocations']) == 3
+    assert not tracemalloc.is_tracing()
+
+def test_sample_allocations():
+    from table import Table
+    from player import RandomPlayer
+    enable(trace_allocations=True, trace_fraction=0.5, trace_period=0.002)
+    try:
+        table = Table([RandomPlayer(f"Bot {i}", 100) for i in range(3)], seed=0)
+        traced = set()
+        for _ in range(300):
+            table.play_streets()
+            traced.add(tracemalloc.is_tracing())
+        metrics = snapshot()
+    finally:
+        disable()
+    assert traced == {True, False} # traced some of the time only
+    assert 'allocations' in metrics and not tracemalloc.is_tracing()
+
+if __name__ == "__main__":
+    import sys
+    import instrumentation # the module table.py registers with, rather than this __main__
+    from table import Table
+    from player import AutomaticPlayer, RandomPlayer
+    num_hands = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    instrumentation.enable(trace_allocations='--allocations' in sys.argv)
+    table = Table([RandomPlayer("Bot 1", 1e9), RandomPlayer("Bot 2", 1e9), AutomaticPlayer("Louis", 1e9)])
+    for _ in range(num_hands):
+        table.play_streets()
+    print(json.dumps(instrumentation.snapshot(), indent=1))
+    instrumentation.disable()
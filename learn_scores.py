@@ -1,15 +1,22 @@
+import os
 import numpy as np
 from generator import generate_royal_flush, generate_flush, generate_four_of_a_kind, generate_full_house, generate_high_card, generate_pair, generate_straight, generate_straight_flush, generate_three_of_a_kind, generate_two_pair
 from environment import suit_values
-from evaluator import evaluation
+from evaluator import values
+from dataset import build, ShardedDataset, MANIFEST
 from sklearn.neural_network import MLPClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score
 
 # generate data
 num_datapoints = 100000
-X = []
-y=[]
+dataset_directory = 'learn_scores_data'
+# a fixed shard size, so building and training hold as much in memory however many datapoints there are
+datapoints_per_shard = 5000
+batch_size = 200
+# the stopping rule MLPClassifier.fit used: stop once the training loss has not
+# improved by tol for n_iter_no_change epochs in a row, or after max_epochs
+max_epochs = 200
+n_iter_no_change = 40
+tol = 1e-4
 
 def generate_all():
     high_card = generate_high_card()
@@ -24,30 +31,42 @@ def generate_all():
     royal_flush = generate_royal_flush()
     return high_card, pair, two_pair, three_of_a_kind, straight, flush, full_house, four_of_a_kind, straight_flush, royal_flush
 
-for _ in range(num_datapoints):
-    (high_card, pair, two_pair, three_of_a_kind, straight, flush,
-     full_house, four_of_a_kind, straight_flush, royal_flush) \
-        = generate_all()
-    for cards in [high_card, pair, two_pair, three_of_a_kind, straight, flush, full_house, four_of_a_kind, straight_flush, royal_flush]:
-
-        x = [item for card in cards for item in [card.value, suit_values[card.suit]]]
-        X.append(x)
-        score = evaluation(cards)
-        # diff_len = 6 - len(score)
-        # for i in range(diff_len):
-        #     score.append(0)
-        y.append(score[0])
-
-X = np.array(X)
-y = np.array(y)
-print(y)
-print(X)
-
-model = MLPClassifier(hidden_layer_sizes=(30, 30), learning_rate_init = 0.001, n_iter_no_change=40, verbose=True, random_state=42)
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, shuffle=True)
-model.fit(X_train, y_train)
-preds = model.predict(X_test)
-accuracy = accuracy_score(preds, y_test)
+if os.path.exists(os.path.join(dataset_directory, MANIFEST)):
+    dataset = ShardedDataset(dataset_directory)
+else:
+    dataset = build(dataset_directory, num_datapoints, datapoints_per_shard=datapoints_per_shard)
+print(f"{len(dataset)} hands in {dataset.num_shards} shards")
+
+# train on the shards a batch at a time, holding the last ones out for testing
+num_test_shards = max(1, dataset.num_shards // 5)
+train_shards = range(dataset.num_shards - num_test_shards)
+test_shards = range(dataset.num_shards - num_test_shards, dataset.num_shards)
+
+model = MLPClassifier(hidden_layer_sizes=(30, 30), learning_rate_init = 0.001, verbose=True, random_state=42)
+rng = np.random.default_rng(42)
+best_loss = np.inf
+epochs_without_improvement = 0
+for epoch in range(max_epochs):
+    total_loss = 0.0
+    rows = 0
+    for X_batch, y_batch in dataset.batches(batch_size, train_shards, rng):
+        model.partial_fit(X_batch, y_batch, classes=np.arange(len(values)))
+        total_loss += model.loss_ * len(y_batch)
+        rows += len(y_batch)
+    loss = total_loss / rows
+    print(f"Epoch {epoch + 1}, loss {loss:.4f}")
+    epochs_without_improvement = epochs_without_improvement + 1 if loss > best_loss - tol else 0
+    best_loss = min(best_loss, loss)
+    if epochs_without_improvement > n_iter_no_change:
+        print(f"Training loss did not improve by {tol} for {n_iter_no_change} epochs, stopping")
+        break
+
+correct = 0
+total = 0
+for X_batch, y_batch in dataset.batches(100000, test_shards):
+    correct += int((model.predict(X_batch) == y_batch).sum())
+    total += len(y_batch)
+accuracy = correct / total
 print(accuracy)
 
 (high_card, pair, two_pair, three_of_a_kind, straight, flush,
@@ -1,7 +1,6 @@
-from evaluator import beats, evaluation, equals
-from itertools import combinations
+from evaluator import best_hand, best_strength, HandState
+from preflop import preflop_equity
 import random
-import torch
 
 class Player:
     def __init__(self, name, money):
@@ -10,6 +9,7 @@ class Player:
         self.money = money
         self.in_hand = True
         self.recent_bet = 0
+        self.table = None # the Table playing this player, which caches hand strengths
 
     def place_bet(self, table_cards, max_bet_so_far):
         raise NotImplementedError
@@ -18,30 +18,22 @@ class Player:
         raise NotImplementedError
 
     def get_best_hand(self, table_cards):
-        best_selection = table_cards[:3] + self.cards
+        return best_hand(table_cards + self.cards)[1]
 
-        # don't use personal cards
-        if len(table_cards) == 5:
-            selection = table_cards
-            if (not equals(selection, best_selection)) and beats(selection, best_selection):
-                best_selection = selection
+    def get_best_strength(self, table_cards):
+        if self.table is not None and table_cards is self.table.face_up_cards:
+            return self.table.best_strength(self)
+        return best_strength([card.id for card in table_cards + self.cards])
 
-        # use one card
-        if len(table_cards) >= 4:
-            for player_card in self.cards:
-                for combination in list(list(x) for x in combinations(table_cards, 4)):
-                    selection = combination + [player_card]
-                    if (not equals(selection, best_selection)) and beats(selection, best_selection):
-                        best_selection = selection
+    def get_hand_category(self, table_cards):
+        """ The `values` category of this player's best hand, from any number of table cards."""
+        if self.table is not None and table_cards is self.table.face_up_cards:
+            return self.table.hand_category(self)
+        return HandState([card.id for card in table_cards + self.cards]).category()
 
-
-        # use both cards:
-        for combination in list(list(x) for x in combinations(table_cards, 3)):
-            selection = combination + self.cards
-            if (not equals(selection, best_selection)) and beats(selection, best_selection):
-                best_selection = selection
-
-        return best_selection
+    def get_preflop_equity(self, num_opponents):
+        """ Equity of this player's hole cards against random hands, from the precomputed preflop table."""
+        return preflop_equity(self.cards, num_opponents)
 
 class RLPlayer(Player):
     def __init__(self, name, money, dqn):
@@ -49,6 +41,7 @@ class RLPlayer(Player):
         self.dqn = dqn
 
     def epsilon_greedy(self, state, epsilon):
+        import torch # only RL players need it, so it is not loaded with the rest of the game
         q_values = self.dqn(state)
         num_actions = q_values.shape[0]
         greedy_act = int(torch.argmax(q_values))
@@ -75,8 +68,7 @@ class RLPlayer(Player):
 
 class AutomaticPlayer(Player):
     def place_bet(self, table_cards, max_bet_so_far):
-        best_hand = self.get_best_hand(table_cards)
-        best_hand_score = evaluation(best_hand)[0]
+        best_hand_score = self.get_hand_category(table_cards)
         if best_hand_score > 4:
             bet, amount = True, self.money # all in for hand above 4
         elif best_hand_score > 2:
@@ -105,8 +97,7 @@ class AutomaticPlayer(Player):
         else:
             fraction_of_prev_bet = difference / self.recent_bet
 
-        best_hand = self.get_best_hand(table_cards)
-        best_hand_score = evaluation(best_hand)[0]
+        best_hand_score = self.get_hand_category(table_cards)
 
         if best_hand_score > 2 and fraction_of_prev_bet < 0.5:
             # if decent hand and not too much to bet, match
@@ -0,0 +1,183 @@
+from cards import Card, cards_by_id
+from canonical import starting_hands, starting_hand_index, starting_hand_name, starting_hand_cards, rank_names
+from equity import sample_counts
+from evaluator import evaluate_batch
+from table_file import StaleTableError
+from concurrent.futures import ProcessPoolExecutor
+import table_file
+import os
+import numpy as np
+
+# Equities of the 169 starting hands, worked out once by simulation:
+#   vs_opponents[hand, k - 1] - equity against k = 1..9 opponents with random cards
+#   head_to_head[hand1, hand2] - equity of hand1 against hand2, all suits averaged over
+# stored as float32 in a table_file whose header holds the sample counts,
+# and read in on first lookup.
+
+MAGIC = b'PKPF'
+FORMAT_VERSION = 1
+MAX_OPPONENTS = 9
+NUM_HANDS = len(starting_hands)
+default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'preflop.bin')
+
+def _hand_combos(name):
+    """ Every pair of card ids with this starting hand name."""
+    high, low = rank_names.index(name[0]), rank_names.index(name[1])
+    combos = [(4 * high + suit1, 4 * low + suit2) for suit1 in range(4) for suit2 in range(4)]
+    if high == low:
+        return [combo for combo in combos if combo[0] < combo[1]]
+    if name[2] == 's':
+        return [combo for combo in combos if combo[0] % 4 == combo[1] % 4]
+    return [combo for combo in combos if combo[0] % 4 != combo[1] % 4]
+
+def _boards(dead, rng):
+    """ A random 5-card board for each row of dead card ids."""
+    num_rows, num_dead = dead.shape
+    # the first 5 cards of a shuffled pack that are not dead
+    draws = rng.permuted(np.tile(np.arange(52, dtype=np.int8), (num_rows, 1)), axis=1)[:, :5 + num_dead]
+    is_dead = (draws[:, :, None] == dead[:, None, :]).any(axis=2)
+    order = np.argsort(is_dead, axis=1, kind='stable')[:, :5]
+    return np.take_along_axis(draws, order, axis=1)
+
+def _head_to_head_row(hand, samples, seed_sequence):
+    """ Equities of starting hand number `hand` against each later hand."""
+    rng = np.random.default_rng(seed_sequence)
+    combos = _hand_combos(starting_hands[hand])
+    row = np.zeros(NUM_HANDS, dtype=np.float32)
+    for other in range(hand, NUM_HANDS):
+        deals = np.array([combo + other_combo for combo in combos for other_combo in _hand_combos(starting_hands[other])
+                          if not set(combo) & set(other_combo)], dtype=np.int8)
+        holes = deals[rng.integers(len(deals), size=samples)]
+        boards = _boards(holes, rng)
+        first = evaluate_batch(np.concatenate([holes[:, :2], boards], axis=1))[0]
+        second = evaluate_batch(np.concatenate([holes[:, 2:], boards], axis=1))[0]
+        row[other] = ((first > second).sum() + (first == second).sum() / 2) / samples
+    return row
+
+def _opponents_row(hand, samples, seed_sequence):
+    """ Equities of starting hand number `hand` against 1..9 random opponents."""
+    hole_ids = [card.id for card in starting_hand_cards(starting_hands[hand])]
+    seeds = seed_sequence.spawn(MAX_OPPONENTS)
+    return np.array([sample_counts(hole_ids, [], k, samples, seeds[k - 1])[3] / samples
+                     for k in range(1, MAX_OPPONENTS + 1)], dtype=np.float32)
+
+def _build_row(hand, head_to_head_samples, opponent_samples, seed_sequence):
+    first, second = seed_sequence.spawn(2)
+    return hand, _head_to_head_row(hand, head_to_head_samples, first), _opponents_row(hand, opponent_samples, second)
+
+def build(path=default_path, head_to_head_samples=2000, opponent_samples=10000, processes=None, seed=0):
+    """ Simulate every starting hand, one process per hand at a time, and write the tables to path."""
+    seeds = np.random.SeedSequence(seed).spawn(NUM_HANDS)
+    head_to_head = np.zeros((NUM_HANDS, NUM_HANDS), dtype=np.float32)
+    vs_opponents = np.zeros((NUM_HANDS, MAX_OPPONENTS), dtype=np.float32)
+    with ProcessPoolExecutor(processes) as pool:
+        rows = pool.map(_build_row, range(NUM_HANDS), [head_to_head_samples] * NUM_HANDS,
+                        [opponent_samples] * NUM_HANDS, seeds)
+        for hand, head_to_head_row, opponents_row in rows:
+            head_to_head[hand, hand:] = head_to_head_row[hand:]
+            vs_opponents[hand] = opponents_row
+    # fill in the lower triangle from the upper one; a hand against itself is even by symmetry
+    lower = np.tril_indices(NUM_HANDS, -1)
+    head_to_head[lower] = 1 - head_to_head.T[lower]
+    np.fill_diagonal(head_to_head, 0.5)
+    write(path, vs_opponents, head_to_head, head_to_head_samples, opponent_samples)
+    return path
+
+def write(path, vs_opponents, head_to_head, head_to_head_samples, opponent_samples):
+    data = vs_opponents.astype('<f4').tobytes() + head_to_head.astype('<f4').tobytes()
+    table_file.write(path, MAGIC, FORMAT_VERSION, data, head_to_head_samples, opponent_samples)
+
+class PreflopTable:
+    """ The preflop equity tables, read from path on first use."""
+    def __init__(self, path=default_path):
+        self.path = path
+        self._vs_opponents = None
+        self._head_to_head = None
+
+    def _read(self):
+        self.head_to_head_samples, self.opponent_samples, data = table_file.read(
+            self.path, MAGIC, FORMAT_VERSION, 4 * NUM_HANDS * (MAX_OPPONENTS + NUM_HANDS), 'preflop table')
+        arrays = np.frombuffer(data, dtype='<f4')
+        self._vs_opponents = arrays[:NUM_HANDS * MAX_OPPONENTS].reshape(NUM_HANDS, MAX_OPPONENTS)
+        self._head_to_head = arrays[NUM_HANDS * MAX_OPPONENTS:].reshape(NUM_HANDS, NUM_HANDS)
+
+    @property
+    def vs_opponents(self) -> np.ndarray:
+        if self._vs_opponents is None:
+            self._read()
+        return self._vs_opponents
+
+    @property
+    def head_to_head(self) -> np.ndarray:
+        if self._head_to_head is None:
+            self._read()
+        return self._head_to_head
+
+    def equity(self, hole_cards: list[Card], num_opponents=1) -> float:
+        """ Equity of the hole cards against num_opponents random hands."""
+        assert 1 <= num_opponents <= MAX_OPPONENTS
+        return float(self.vs_opponents[starting_hand_index[starting_hand_name(hole_cards)], num_opponents - 1])
+
+    def versus(self, hole_cards: list[Card], other_hole_cards: list[Card]) -> float:
+        """ Equity of the hole cards against the other's starting hand, suits averaged over."""
+        return float(self.head_to_head[starting_hand_index[starting_hand_name(hole_cards)],
+                                       starting_hand_index[starting_hand_name(other_hole_cards)]])
+
+def load(path=default_path) -> PreflopTable:
+    """ The preflop table at path, shared by every caller in this process."""
+    return table_file.load(PreflopTable, path)
+
+def preflop_equity(hole_cards: list[Card], num_opponents=1, path=default_path) -> float:
+    return load(path).equity(hole_cards, num_opponents)
+
+
+def test_hand_combos():
+    assert [len(_hand_combos(name)) for name in ['AA', 'AKs', 'AKo']] == [6, 4, 12]
+    assert sum(len(_hand_combos(name)) for name in starting_hands) == 1326
+    assert all(starting_hand_name([cards_by_id[a], cards_by_id[b]]) == name
+               for name in ['T9s', '22', '72o'] for a, b in _hand_combos(name))
+
+def test_boards_avoid_dead_cards():
+    rng = np.random.default_rng(0)
+    dead = np.tile(np.arange(4, dtype=np.int8), (1000, 1))
+    boards = _boards(dead, rng)
+    assert boards.shape == (1000, 5) and boards.min() >= 4
+    assert all(len(set(board)) == 5 for board in boards.tolist())
+
+def test_aces_row():
+    seed = np.random.SeedSequence(0)
+    row = _head_to_head_row(starting_hand_index['AA'], 300, seed)
+    assert abs(row[starting_hand_index['AA']] - 0.5) < 0.05
+    assert row[starting_hand_index['72o']] > 0.8
+    opponents = _opponents_row(starting_hand_index['AA'], 1000, seed)
+    assert opponents[0] > 0.8 and all(opponents[:-1] > opponents[1:])
+
+def test_write_and_load():
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        _check_write_and_load(os.path.join(directory, 'preflop.bin'))
+
+def _check_write_and_load(path):
+    vs_opponents = np.linspace(0, 1, NUM_HANDS * MAX_OPPONENTS).reshape(NUM_HANDS, MAX_OPPONENTS)
+    head_to_head = np.full((NUM_HANDS, NUM_HANDS), 0.5)
+    write(path, vs_opponents, head_to_head, 10, 20)
+    table = PreflopTable(path)
+    hand = [Card('spades', 14), Card('hearts', 14)]
+    assert table.equity(hand, 3) == np.float32(vs_opponents[0, 2])
+    assert table.versus(hand, [Card('clubs', 7), Card('clubs', 2)]) == 0.5
+    assert table.opponent_samples == 20
+    assert load(path) is load(path)
+    with open(path, 'r+b') as f:
+        f.truncate(1000)
+    try:
+        PreflopTable(path).vs_opponents
+        assert False, "A truncated table should be rejected"
+    except StaleTableError:
+        pass
+
+if __name__ == "__main__":
+    test_hand_combos()
+    test_boards_avoid_dead_cards()
+    test_aces_row()
+    test_write_and_load()
+    print(f"Wrote {build()}")
@@ -0,0 +1,124 @@
+from evaluator import evaluate_batch, strength5, _scores
+from table_file import StaleTableError
+from itertools import combinations
+from math import comb
+import table_file
+import os
+import zlib
+import numpy as np
+
+# The strength of every 5-card hand, stored as uint16 in a flat file indexed
+# by the hand's combinatorial rank.  The file is memory-mapped read-only, so
+# every process using it shares the one copy in the page cache.
+#
+# It is a table_file whose header holds the number of hands and a
+# fingerprint of the evaluator's strength ordering; a table built by a
+# different evaluator is rejected rather than silently giving wrong answers.
+
+MAGIC = b'PKR5'
+FORMAT_VERSION = 2
+NUM_HANDS = 2598960
+default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rank_table.bin')
+
+def evaluator_fingerprint():
+    return zlib.crc32(repr(_scores).encode())
+
+# _binomials[n][k] = n choose k
+_binomials = [[comb(n, k) for k in range(6)] for n in range(53)]
+_binomials_np = np.array(_binomials, dtype=np.int64)
+
+def hand_index(ids) -> int:
+    """ The combinatorial (colex) rank, 0 to 2598959, of a set of 5 card ids."""
+    a, b, c, d, e = sorted(ids)
+    return _binomials[a][1] + _binomials[b][2] + _binomials[c][3] + _binomials[d][4] + _binomials[e][5]
+
+def hand_indices(ids) -> np.ndarray:
+    """ hand_index of each row of an (N, 5) array of card ids."""
+    ids = np.sort(np.asarray(ids), axis=1)
+    return sum(_binomials_np[ids[:, k], k + 1] for k in range(5))
+
+def build(path=default_path):
+    """ Evaluate every 5-card hand and write the table to path."""
+    hands = np.array(list(combinations(range(52), 5)), dtype=np.int8)
+    strengths = np.zeros(NUM_HANDS, dtype=np.uint16)
+    strengths[hand_indices(hands)] = evaluate_batch(hands)[0]
+    assert strengths.all()
+    return table_file.write(path, MAGIC, FORMAT_VERSION, strengths.astype('<u2').tobytes(), NUM_HANDS,
+                            evaluator_fingerprint())
+
+class RankTable:
+    """ A read-only view of a built rank table, mapped on first use."""
+    def __init__(self, path=default_path, verify=True):
+        self.path = path
+        self.verify = verify
+        self._strengths = None
+
+    @property
+    def strengths(self) -> np.ndarray:
+        if self._strengths is None:
+            self._open()
+        return self._strengths
+
+    def _open(self):
+        count, fingerprint, data = table_file.read(self.path, MAGIC, FORMAT_VERSION, 2 * NUM_HANDS, 'rank table',
+                                                   self.verify, mapped=True)
+        if count != NUM_HANDS or fingerprint != evaluator_fingerprint():
+            raise StaleTableError(f"{self.path} was built by a different evaluator, rebuild it")
+        self._strengths = np.frombuffer(data, dtype='<u2')
+
+    def strength5(self, a: int, b: int, c: int, d: int, e: int) -> int:
+        return int(self.strengths[hand_index((a, b, c, d, e))])
+
+    def lookup(self, ids) -> np.ndarray:
+        """ Strengths of an (N, 5) array of card ids."""
+        return self.strengths[hand_indices(ids)].astype(np.int32)
+
+def load(path=default_path, verify=True) -> RankTable:
+    """ The rank table at path, shared by every caller in this process."""
+    return table_file.load(RankTable, path, verify)
+
+
+def test_hand_index():
+    assert hand_index([0, 1, 2, 3, 4]) == 0
+    assert hand_index([47, 48, 49, 50, 51]) == NUM_HANDS - 1
+    hands = np.array(list(combinations(range(12), 5)))
+    indices = hand_indices(hands)
+    assert sorted(indices) == list(range(len(hands)))
+    assert [hand_index(hand) for hand in hands[:50]] == list(indices[:50])
+
+def test_build_and_load():
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        _check_build_and_load(os.path.join(directory, 'rank_table.bin'))
+
+def _check_build_and_load(path):
+    build(path)
+    table = RankTable(path)
+    rng = np.random.default_rng(0)
+    hands = np.argsort(rng.random((1000, 52)), axis=1)[:, :7]
+    assert list(table.lookup(hands[:, :5])) == list(evaluate_batch(hands[:, :5])[0])
+    assert table.strength5(*hands[0, :5]) == strength5(*hands[0, :5])
+    assert list(evaluate_batch(hands, rank_table=table)[0]) == list(evaluate_batch(hands)[0])
+
+    with open(path, 'r+b') as f:
+        f.seek(table_file.HEADER.size + 100)
+        f.write(b'\xff\xff')
+    try:
+        RankTable(path).strengths
+        assert False, "A corrupted table should be rejected"
+    except StaleTableError:
+        pass
+
+    for size in [0, table_file.HEADER.size - 1, table_file.HEADER.size + 10]:
+        with open(path, 'r+b') as f:
+            f.truncate(size)
+        try:
+            RankTable(path).strengths
+            assert False, "A truncated table should be rejected"
+        except StaleTableError:
+            pass
+
+if __name__ == "__main__":
+    test_hand_index()
+    test_build_and_load()
+    print(f"Wrote {build()}")
@@ -1,15 +1,19 @@
-from cards import Pack
+from cards import Deck
 from player import Player, AutomaticPlayer, RandomPlayer, RLPlayer
-from evaluator import winners, values
-import matplotlib.pyplot as plt
+from evaluator import winners_by_strength, HandState, values
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from statistics import NormalDist
+import instrumentation
+import json
+import random
 import numpy as np
 
 hands = {value: key for key, value in values.items()}
 
 class Table:
-    """ A simple poker game when players bet once per round."""
-    def __init__(self, players: list[Player], verbose=0):
-        self.pack = Pack()
+    """ A simple poker game when players bet once per round (play_hand) or once per street (play_streets)."""
+    def __init__(self, players: list[Player], verbose=0, seed=None, history=None):
+        self.pack = Deck(seed)
         self.pack.shuffle()
         self.players_list = players
         self.rotation_order = players[:]
@@ -18,11 +22,22 @@ class Table:
         self.money = 0
         self.verbose = verbose
         self.highest_bet = 0
+        # how many rounds of betting the hand in play has had, less one
+        self.betting_round = -1
+        # a hand_history.HandHistoryWriter to record each hand in, and the record of the hand in play
+        self.history = history
+        self.seats = {player.name: seat for seat, player in enumerate(players)}
+        self.record = None
+        # the HandState of each player still in the hand, by name, brought up to date as each card is dealt
+        self.hand_states = {}
+        for player in players:
+            player.table = self
 
     def reset(self):
-        self.pack = Pack()
         self.pack.shuffle()
         self.face_up_cards = []
+        self.hand_states = {}
+        self.betting_round = -1
         self.players_list = list(self.players_dict.values())
 
     def new_hand_deal(self):
@@ -34,11 +49,43 @@ class Table:
             card1 = self.pack.top_card()
             card2 = self.pack.top_card()
             player.cards = [card1, card2]
+        self.hand_states = {player.name: HandState([card.id for card in player.cards]) for player in self.players_list}
+        if self.history is not None:
+            self.record = self.history.new_record()
+            for position, player in enumerate(self.players_list):
+                seat = self.seats[player.name]
+                self.record['order'][position] = seat
+                self.record['hole'][seat] = [card.id for card in player.cards]
+                self.record['money'][seat] = player.money
 
     def rotate_players(self):
         self.rotation_order.append(self.rotation_order.pop(0))
         self.players_list = [player for player in self.rotation_order]
 
+    def hand_state(self, player):
+        state = self.hand_states.get(player.name)
+        if state is None:
+            instrumentation.count('hand_states_rebuilt')
+            # cards set by hand rather than dealt, as when replaying
+            state = self.hand_states[player.name] = HandState([card.id for card in self.face_up_cards + player.cards])
+        return state
+
+    def best_strength(self, player):
+        """ The strength of player's best hand from their cards and the face up cards, worked out once per deal."""
+        return self.hand_state(player).strength()
+
+    def hand_category(self, player):
+        """ The `values` category of player's best hand so far, from the hole cards on."""
+        return self.hand_state(player).category()
+
+    def deal_face_up(self):
+        card = self.pack.top_card()
+        # only the players still in the hand need their hands brought up to date
+        self.hand_states = {player.name: self.hand_state(player) for player in self.players_list}
+        for state in self.hand_states.values():
+            state.add(card.id)
+        self.face_up_cards.append(card)
+
     def print_face_up(self):
         print([str(card) for card in self.face_up_cards])
 
@@ -49,75 +96,130 @@ class Table:
 
     def flop(self):
         for i in range(3):
-            self.face_up_cards.append(self.pack.top_card())
+            self.deal_face_up()
         if self.verbose >= 1:
             self.print_face_up()
 
     def turn(self):
-        self.face_up_cards.append(self.pack.top_card())
+        self.deal_face_up()
         if self.verbose >= 1:
             self.print_face_up()
 
     def river(self):
-        self.face_up_cards.append(self.pack.top_card())
+        self.deal_face_up()
         if self.verbose >= 1:
             self.print_face_up()
 
-    def take_bets(self):
+    def new_betting_round(self):
         self.highest_bet = 0
+        self.betting_round += 1
+        if self.record is not None:
+            self.record['shown'][self.betting_round] = len(self.face_up_cards)
+
+    def take_bets(self):
+        decide_now(self.bets())
+
+    # take_bets and get_matches one decision at a time, for callers that get the decisions some other way:
+    # each generator yields what a player's place_bet or match returned and is sent back the decision
+    def bets(self):
+        self.new_betting_round()
         remove_players = []
         for player in self.players_list:
-            bet, amount = player.place_bet(self.face_up_cards, self.highest_bet)
-            if bet:
-                player.money -= amount # take bet
-                self.money += amount # add to pot
-                self.highest_bet = max(self.highest_bet, amount)
-                if self.verbose >= 1:
-                    print(f'{player.name} betted {amount:.2f}')
-            else:
+            bet, amount = yield player.place_bet(self.face_up_cards, self.highest_bet)
+            if not self.apply_bet(player, bet, amount):
                 remove_players.append(player)
-                if self.verbose >= 1:
-                    print(f"{player.name} didn't bet.  Kicked out")
-
-        for player in remove_players:
-            self.players_list.remove(player)
-
-        if self.verbose >= 1:
-            print(f"Players remaining: {[player.name for player in self.players_list]}")
+        self.drop_players(remove_players)
 
-    def get_matches(self):
+    def matches(self):
         remove_players = []
         for player in self.players_list:
-            match, amount = player.match(self.face_up_cards, self.highest_bet)
-            if match:
-                player.money -= amount  # take bet
-                self.money += amount  # add to pot
-                if self.verbose >= 1 and amount > 0:
-                    print(f'{player.name} matched with {amount:.2f} up to {self.highest_bet:.2f}')
-            else:
+            match, amount = yield player.match(self.face_up_cards, self.highest_bet)
+            if not self.apply_match(player, match, amount):
                 remove_players.append(player)
-                if self.verbose >= 1:
-                    print(f"{player.name} didn't match.  Kicked out.")
+        self.drop_players(remove_players)
 
+    def apply_bet(self, player, bet, amount):
+        """ Take player's bet, if they bet; whether they are still in the hand."""
+        if bet:
+            player.money -= amount # take bet
+            self.money += amount # add to pot
+            self.highest_bet = max(self.highest_bet, amount)
+            if self.record is not None:
+                self.record_bet(player, amount)
+            if self.verbose >= 1:
+                print(f'{player.name} betted {amount:.2f}')
+        else:
+            instrumentation.count('folds')
+            if self.verbose >= 1:
+                print(f"{player.name} didn't bet.  Kicked out")
+        return bool(bet)
 
+    def apply_match(self, player, match, amount):
+        """ Take what player put in to match, if they matched; whether they are still in the hand."""
+        if match:
+            player.money -= amount  # take bet
+            self.money += amount  # add to pot
+            if self.record is not None:
+                seat = self.seats[player.name]
+                self.record['matched'][self.betting_round] |= 1 << seat
+                self.record['matches'][self.betting_round, seat] += amount
+            if self.verbose >= 1 and amount > 0:
+                print(f'{player.name} matched with {amount:.2f} up to {self.highest_bet:.2f}')
+        else:
+            instrumentation.count('folds')
+            if self.verbose >= 1:
+                print(f"{player.name} didn't match.  Kicked out.")
+        return bool(match)
+
+    def drop_players(self, remove_players):
+        if remove_players and len(remove_players) == len(self.players_list):
+            # everyone folded: the last of them to fold is the last player standing, and takes the pot
+            remove_players = remove_players[:-1]
         for player in remove_players:
             self.players_list.remove(player)
         if self.verbose >= 1:
             print(f"Players remaining: {[player.name for player in self.players_list]}")
 
+    def record_bet(self, player, amount):
+        seat = self.seats[player.name]
+        self.record['betted'][self.betting_round] |= 1 << seat
+        self.record['bets'][self.betting_round, seat] += amount
+
+    def get_matches(self):
+        decide_now(self.matches())
+
     def give_money_to_winner(self):
-        hand_winners = winners([player.get_best_hand(self.face_up_cards) for player in self.players_list])
+        """ Split the pot between the best hands left, or give it to the last player in; returns the winners."""
+        if len(self.players_list) == 1:
+            hand_winners = {0} # everyone else folded, so there is nothing to evaluate
+            instrumentation.count('uncontested')
+        else:
+            hand_winners = winners_by_strength([self.best_strength(player) for player in self.players_list])
+            instrumentation.count('showdowns')
         if self.verbose >= 1:
             print(f"The winner(s) are: {[self.players_list[hand_winner].name for hand_winner in hand_winners]}")
-        pot_split = self.money / len(hand_winners)
-        for hand_winner in hand_winners:
-            hand_winner_player = self.players_list[hand_winner]
+        if self.record is not None:
+            self.record['board'][:len(self.face_up_cards)] = [card.id for card in self.face_up_cards]
+            self.record['pot'] = self.money
+            for hand_winner in hand_winners:
+                self.record['winners'] |= 1 << self.seats[self.players_list[hand_winner].name]
+            self.history.commit()
+            self.record = None
+        winners = [self.players_list[hand_winner] for hand_winner in hand_winners]
+        pot_split = self.money / len(winners)
+        for hand_winner_player in winners:
             hand_winner_player.money += pot_split
             self.money -= pot_split
         assert abs(self.money) < 0.001 # allow rounding error
         self.money = 0
+        return winners
 
-    def play_hand(self):
+    def betting_rounds(self, streets=False):
+        """ Deal a hand and stop before each round of betting, for the caller to take the bets and matches.
+
+        With streets there is a round before the flop and after the flop, the turn
+        and the river, until one player is left; otherwise one once the whole board is dealt.
+        """
         assert all(player.money >= 0 for player in self.players_list)
         self.new_hand_deal()
         # print player's cards
@@ -125,22 +227,42 @@ class Table:
             for player in self.players_list:
                 print(f'{player.name}: {[str(card) for card in player.cards]}')
 
-        self.flop()
-        self.turn()
-        self.river()
-        # if verbose >= 1:
-        #     print([[hands[i], j] for i, j in [evaluation(player.get_best_hand(table.face_up_cards)) for player in self.players]])
-        self.take_bets()
-        self.get_matches()
-        self.give_money_to_winner()
-        this_round_winner = winners([player.get_best_hand(self.face_up_cards) for player in self.players_list])
+        for street in [None, self.flop, self.turn, self.river] if streets else [self.deal_table_cards]:
+            if street is not None:
+                street()
+            yield
+            if len(self.players_list) == 1:
+                break
+
+    def finish_hand(self):
+        """ Pay the winners of the hand betting_rounds dealt and clear the table; returns the winners."""
+        winners = self.give_money_to_winner()
         if self.verbose >= 1:
             for player in self.players_dict.values():
                 print(f"{player.name} has {player.money}")
         self.reset()
+        return winners
+
+    def play_hand(self):
+        """ Play a hand with one round of betting once the whole board is dealt; returns the winners."""
+        for _ in self.betting_rounds():
+            self.take_bets()
+            self.get_matches()
+        return self.finish_hand()
+
+    def play_streets(self):
+        """ Play a hand with a round of betting before the flop and after the flop, the turn and the river.
+
+        The hand ends as soon as one player is left, who takes the pot without a showdown.
+        Returns the winners.
+        """
+        for _ in self.betting_rounds(streets=True):
+            self.take_bets()
+            self.get_matches()
+        return self.finish_hand()
 
     def take_bets_rl(self, rl_bet, rl_amount):
-        self.highest_bet = 0
+        self.new_betting_round()
         remove_players = []
         for player in self.players_list:
             if isinstance(player, RLPlayer):
@@ -148,50 +270,167 @@ class Table:
             else:
                 bet, amount = player.place_bet(self.face_up_cards, self.highest_bet)
 
-            if bet and amount >= self.highest_bet:
-                player.money -= amount # take bet
-                self.money += amount # add to pot
-                self.highest_bet = max(self.highest_bet, amount)
-                if self.verbose >= 1:
-                    print(f'{player.name} betted {amount:.2f}')
-            else:
+            if not self.apply_bet(player, bet and amount >= self.highest_bet, amount):
                 remove_players.append(player)
-                if self.verbose >= 1:
-                    print(f"{player.name} didn't bet.  Kicked out")
+        self.drop_players(remove_players)
 
-        for player in remove_players:
-            self.players_list.remove(player)
+def decide_now(steps):
+    """ Run a Table.bets or Table.matches generator, sending each player's decision straight back."""
+    try:
+        decision = next(steps)
+        while True:
+            decision = steps.send(decision)
+    except StopIteration:
+        pass
 
-        if self.verbose >= 1:
-            print(f"Players remaining: {[player.name for player in self.players_list]}")
+instrumentation.register(Table, {
+    'new_hand_deal': 'deal', 'deal_face_up': 'deal', 'take_bets': 'take_bets', 'take_bets_rl': 'take_bets',
+    'get_matches': 'get_matches', 'best_strength': 'best_hand', 'hand_category': 'best_hand',
+    'give_money_to_winner': 'give_money_to_winner', 'play_hand': 'play_hand', 'play_streets': 'play_streets',
+})
+
+def test_hand_states_follow_the_deal():
+    from evaluator import best_strength, hand_category
+    players = [AutomaticPlayer(f"Bot {i}", 100) for i in range(4)]
+    table = Table(players, seed=2)
+    table.new_hand_deal()
+    assert all(table.hand_state(player).num_cards == 2 for player in players)
+    for street in [table.flop, table.turn, table.river]:
+        street()
+        for player in players:
+            ids = [card.id for card in table.face_up_cards + player.cards]
+            assert player.get_best_strength(table.face_up_cards) == best_strength(ids)
+            assert player.get_hand_category(table.face_up_cards) == hand_category(best_strength(ids))
+    # a player who is out of the hand is no longer kept up to date
+    table.reset()
+    table.new_hand_deal()
+    table.players_list.remove(players[0])
+    table.flop()
+    assert set(table.hand_states) == {player.name for player in players[1:]}
+
+def test_play_streets():
+    random.seed(6)
+    players = [RandomPlayer("Bot 1", 100), RandomPlayer("Bot 2", 100), AutomaticPlayer("Louis", 100)]
+    table = Table(players, seed=6)
+    showdowns = []
+    original = table.best_strength
+    table.best_strength = lambda player: showdowns.append(player) or original(player)
+    folded_early = 0
+    for _ in range(50):
+        showdowns.clear()
+        table.play_streets()
+        assert abs(sum(player.money for player in players) - 300) < 1e-6 and table.money == 0
+        folded_early += not showdowns
+    assert folded_early > 0 # hands won by everyone else folding never evaluate a hand
 
-def run_experiment():
-    num_players = 4
-    num_hands = 10
-    initial_money = 100
-
-    num_experiments = 100
-    results = [[0] * num_players]
-
-    for experiment in range(num_experiments):
-        players = [RandomPlayer(f"Bot {bot_num}", initial_money) for bot_num in range(1, num_players)]
-        players.append(AutomaticPlayer("Louis", initial_money))
-        table = Table(players, verbose=1)
-        for _ in range(num_hands):
-            table.play_hand()
-        results.append([player.money + results[experiment][index] for index, player in enumerate(players)])
-    results = np.array(results)
-    for i in range(num_players):
-        plt.plot(results[:, i], label=table.players_list[i].name)
+def spawn_seeds(seed, n):
+    """ n independent integer seeds from seed, or from a SeedSequence whose next children they are.
+
+    Tasks seeded this way play the same however they are spread over processes.
+    """
+    seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return [int(child.generate_state(1)[0]) for child in seed_sequence.spawn(n)]
+
+def seed_players(seed):
+    """ Seed what the players draw from in this process: RandomPlayer uses the random module's generator."""
+    random.seed(seed)
+
+def _play_experiment(experiment, seed, num_players, num_hands, initial_money):
+    """ One experiment, seeded on its own so it plays the same in any worker: each player's final money."""
+    seed_players(seed)
+    players = [RandomPlayer(f"Bot {bot_num}", initial_money) for bot_num in range(1, num_players)]
+    players.append(AutomaticPlayer("Louis", initial_money))
+    table = Table(players, seed=seed)
+    for _ in range(num_hands):
+        table.play_hand()
+    return experiment, [player.money for player in players]
+
+def run_experiment(num_experiments=100, num_players=4, num_hands=10, initial_money=100,
+                   processes=None, seed=0, confidence=0.95, output='experiment_results.json'):
+    """ Play num_experiments independent experiments over a process pool and write their aggregate to output.
+
+    Experiments get seeds spawned from seed, so the results do not depend on
+    how many processes share the work.  The file holds each experiment's final
+    money, every player's cumulative return and its mean with a confidence interval.
+    """
+    seeds = spawn_seeds(seed, num_experiments)
+    names = [f"Bot {bot_num}" for bot_num in range(1, num_players)] + ["Louis"]
+    money = np.zeros((num_experiments, num_players))
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [pool.submit(_play_experiment, experiment, experiment_seed, num_players, num_hands, initial_money)
+                   for experiment, experiment_seed in enumerate(seeds)]
+        for done, future in enumerate(as_completed(futures), 1):
+            experiment, final_money = future.result()
+            money[experiment] = final_money
+            if done % max(1, num_experiments // 10) == 0:
+                print(f"{done}/{num_experiments} experiments done")
+
+    results = money.cumsum(axis=0)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    mean = money.mean(axis=0)
+    ci_half_width = z * money.std(axis=0, ddof=1) / np.sqrt(num_experiments) if num_experiments > 1 else np.full(num_players, np.inf)
+    summary = {
+        'num_experiments': num_experiments, 'num_players': num_players, 'num_hands': num_hands,
+        'initial_money': initial_money, 'seed': seed, 'confidence': confidence, 'players': names,
+        'final_money': money.tolist(), 'cumulative_return': results.tolist(),
+        'mean': mean.tolist(), 'ci_half_width': ci_half_width.tolist(),
+    }
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(summary, f, indent=1)
+    return summary
+
+def plot_experiment(summary):
+    """ Plot each player's cumulative return, from run_experiment's result or the file it wrote."""
+    import matplotlib.pyplot as plt
+    if isinstance(summary, str):
+        with open(summary) as f:
+            summary = json.load(f)
+    results = np.array([[0] * summary['num_players']] + summary['cumulative_return'])
+    for i, name in enumerate(summary['players']):
+        plt.plot(results[:, i], label=name)
     plt.ylabel("Cumulative return")
     plt.xlabel("Number of experiments")
     plt.legend()
     plt.show()
-    print(sum(results[-1]))
-    print(num_experiments * (initial_money * num_players))
+
+
+def test_everyone_folds():
+    class Folder(Player):
+        def place_bet(self, table_cards, max_bet_so_far):
+            return False, None
+
+        def match(self, table_cards, high_bet):
+            return False, None
+
+    players = [Folder(f"Bot {i}", 100) for i in range(3)]
+    table = Table(players, seed=0)
+    for _ in range(3):
+        assert len(table.play_streets()) == 1 # the last to fold keeps the (empty) pot
+    assert [player.money for player in players] == [100] * 3
+
+def test_spawn_seeds():
+    assert spawn_seeds(0, 3) == spawn_seeds(0, 3) != spawn_seeds(1, 3)
+    seed_sequence = np.random.SeedSequence(0)
+    first, second = spawn_seeds(seed_sequence, 3), spawn_seeds(seed_sequence, 3)
+    assert first == spawn_seeds(0, 3) and len(set(first + second)) == 6 # each call spawns the next children
+
+def test_run_experiment(tmp_path):
+    output = str(tmp_path / 'results.json')
+    summary = run_experiment(num_experiments=6, num_players=3, num_hands=3, processes=2, seed=5, output=output)
+    with open(output) as f:
+        assert json.load(f) == summary
+    assert np.allclose(np.sum(summary['final_money'], axis=1), 300) # money only changes hands
+    again = run_experiment(num_experiments=6, num_players=3, num_hands=3, processes=1, seed=5, output=None)
+    assert again['final_money'] == summary['final_money']
 
 if __name__ == "__main__":
-    run_experiment()
+    summary = run_experiment()
+    for name, mean, ci_half_width in zip(summary['players'], summary['mean'], summary['ci_half_width']):
+        print(f"{name}: {mean:.2f} +/- {ci_half_width:.2f} per experiment")
+    print(sum(summary['cumulative_return'][-1]))
+    print(summary['num_experiments'] * (summary['initial_money'] * summary['num_players']))
+    plot_experiment(summary)
 
 
     # initial_money = 100
@@ -0,0 +1,99 @@
+import mmap
+import os
+import struct
+import zlib
+
+# The file format shared by the precomputed tables (rank_table, preflop): a
+# 32-byte header of magic, format version, two fields of the table's own and
+# a CRC32 of the data, then the data.  A file that is not what the reader
+# expects raises StaleTableError, for the caller to rebuild it.
+
+HEADER = struct.Struct('<4sHHIII12x') # magic, version, spare, two fields, CRC32; 32 bytes keeps the data aligned
+
+class StaleTableError(Exception):
+    pass
+
+def write(path, magic, version, data: bytes, first=0, second=0):
+    """ Write a table file, to a temporary file renamed into place so a reader never sees half of one."""
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(magic, version, 0, first, second, zlib.crc32(data)))
+        f.write(data)
+    os.replace(path + '.tmp', path)
+    return path
+
+def read(path, magic, version, data_size, kind, verify=True, mapped=False):
+    """ The two header fields and the data of the table file at path.
+
+    Args:
+        magic, version: what the header must hold
+        data_size: how many bytes of data must follow it
+        kind: what the table is called in errors
+        verify: whether to check the data against its CRC32
+        mapped: whether to memory-map the file read-only rather than read it in
+
+    Returns:
+        (first, second, data), data being a memoryview of the bytes after the header
+    """
+    with open(path, 'rb') as f:
+        # a file cut short before the end of the header can be neither mapped nor unpacked
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            raise StaleTableError(f"{path} is truncated")
+        contents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if mapped else f.read()
+    file_magic, file_version, _, first, second, checksum = HEADER.unpack_from(contents)
+    error = None
+    if file_magic != magic or file_version != version:
+        error = f"{path} is not a version {version} {kind}"
+    elif len(contents) != HEADER.size + data_size:
+        error = f"{path} is truncated"
+    elif verify and zlib.crc32(memoryview(contents)[HEADER.size:]) != checksum:
+        error = f"{path} failed its checksum"
+    if error is not None:
+        if mapped:
+            contents.close()
+        raise StaleTableError(error)
+    return first, second, memoryview(contents)[HEADER.size:]
+
+_tables = {}
+
+def load(table_class, path, *args):
+    """ The table_class(path, *args) for path, made once and shared by every caller in this process."""
+    key = (table_class, path)
+    if key not in _tables:
+        _tables[key] = table_class(path, *args)
+    return _tables[key]
+
+
+def test_write_and_read():
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        path = write(os.path.join(directory, 'table.bin'), b'TEST', 3, bytes(range(100)), 7, 8)
+        for mapped in (False, True):
+            first, second, data = read(path, b'TEST', 3, 100, 'test table', mapped=mapped)
+            assert (first, second, bytes(data)) == (7, 8, bytes(range(100)))
+            del data
+        for args in [(b'TEST', 4, 100), (b'BEST', 3, 100), (b'TEST', 3, 99)]:
+            try:
+                read(path, *args, 'test table', mapped=True)
+                assert False, "a table that is not as expected should be rejected"
+            except StaleTableError:
+                pass
+        with open(path, 'r+b') as f:
+            f.seek(HEADER.size + 50)
+            f.write(b'\xff')
+        try:
+            read(path, b'TEST', 3, 100, 'test table')
+            assert False, "a corrupted table should be rejected"
+        except StaleTableError:
+            pass
+        read(path, b'TEST', 3, 100, 'test table', verify=False)
+        for size in [0, HEADER.size - 1]:
+            with open(path, 'r+b') as f:
+                f.truncate(size)
+            try:
+                read(path, b'TEST', 3, 100, 'test table')
+                assert False, "a truncated table should be rejected"
+            except StaleTableError:
+                pass
+
+if __name__ == "__main__":
+    test_write_and_read()
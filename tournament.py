@@ -0,0 +1,228 @@
+from table import Table, spawn_seeds, seed_players
+from player import AutomaticPlayer, RandomPlayer
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import combinations
+from math import ceil
+import random
+import numpy as np
+
+# Tournaments seat a field of players at tables of up to table_size and play
+# in rounds: every table plays hands_per_round hands in a worker process,
+# players left with less than min_money are out, and the rest are reseated
+# over as few tables as they fit at, evenly.  Tables are only balanced between
+# rounds, so one whose players go broke plays the rest of its round short-handed.  run() plays any number of
+# tournaments together, sending each table to the pool as soon as its round
+# can start, so the workers stay busy however the tournaments progress.
+# Players are given as (name, Player class) and built inside the workers.
+
+def rebalance(tables: list[list[str]], table_size: int) -> list[list[str]]:
+    """ Seat the same players at as few tables as hold them, no two tables differing by more than one player.
+
+    Players stay where they are where they can: only the smallest tables are
+    broken up and only the largest give up players.
+    """
+    tables = sorted((list(seats) for seats in tables if seats), key=len)
+    needed = ceil(sum(len(seats) for seats in tables) / table_size)
+    while len(tables) > max(needed, 1):
+        for name in tables.pop(0):
+            min(tables, key=len).append(name)
+    while tables and len(max(tables, key=len)) - len(min(tables, key=len)) > 1:
+        min(tables, key=len).append(max(tables, key=len).pop())
+    return tables
+
+def _play_table(seats, num_hands, seed, streets):
+    """ num_hands hands at one table; each seat's money before and after, by name."""
+    seed_players(seed)
+    players = [player_class(name, money) for name, player_class, money in seats]
+    table = Table(players, seed=seed)
+    for _ in range(num_hands):
+        if streets:
+            table.play_streets()
+        else:
+            table.play_hand()
+    return {name: money for name, _, money in seats}, {player.name: player.money for player in players}
+
+class Ratings:
+    """ Elo ratings updated from every table's result: each pair of players at a table is a game won by whoever gained more."""
+    def __init__(self, initial=1500, k=16):
+        self.initial = initial
+        self.k = k
+        self.ratings = {}
+
+    def update(self, before, after):
+        names = list(before)
+        if len(names) < 2:
+            return
+        change = {name: 0.0 for name in names}
+        for a, b in combinations(names, 2):
+            gain_a, gain_b = after[a] - before[a], after[b] - before[b]
+            score = 1.0 if gain_a > gain_b else 0.0 if gain_a < gain_b else 0.5
+            expected = 1 / (1 + 10 ** ((self[b] - self[a]) / 400))
+            # scaled so that a table counts as much as one game, however many sit at it
+            delta = self.k * (score - expected) / (len(names) - 1)
+            change[a] += delta
+            change[b] -= delta
+        for name, delta in change.items():
+            self.ratings[name] = self[name] + delta
+
+    def __getitem__(self, name):
+        return self.ratings.get(name, self.initial)
+
+class Tournament:
+    """ A freezeout between entrants, (name, Player class) pairs, that all start with initial_money.
+
+    It ends when one player is left or after max_rounds rounds.  Players who go
+    broke stay seated until the end of the round, so a table can play out a round
+    short-handed; the smaller hands_per_round, the sooner it is rebalanced.
+    """
+    def __init__(self, entrants, table_size=6, initial_money=100, hands_per_round=10, min_money=1.0,
+                 max_rounds=100, streets=False, seed=0):
+        assert len(entrants) >= 2 and table_size >= 2
+        self.player_classes = dict(entrants)
+        self.table_size = table_size
+        self.hands_per_round = hands_per_round
+        self.min_money = min_money
+        self.max_rounds = max_rounds
+        self.streets = streets
+        self.seed = seed
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.money = {name: initial_money for name in self.player_classes}
+        names = list(self.player_classes)
+        random.Random(seed).shuffle(names)
+        num_tables = ceil(len(names) / table_size)
+        self.tables = [names[i::num_tables] for i in range(num_tables)]
+        self.busted = [] # names in the order they went out; players out in the same round by money left
+        self.round = 0
+        self.pending = 0
+
+    @property
+    def finished(self):
+        return sum(len(seats) for seats in self.tables) <= 1 or self.round >= self.max_rounds
+
+    def table_tasks(self):
+        """ The arguments of _play_table for each table of the coming round."""
+        seeds = spawn_seeds(self.seed_sequence, len(self.tables))
+        return [([(name, self.player_classes[name], self.money[name]) for name in seats],
+                 self.hands_per_round, seed, self.streets) for seats, seed in zip(self.tables, seeds)]
+
+    def record(self, after):
+        self.money.update(after)
+
+    def finish_round(self):
+        """ Knock out those short of min_money and reseat the rest."""
+        self.round += 1
+        out = sorted((name for seats in self.tables for name in seats if self.money[name] < self.min_money),
+                     key=lambda name: (self.money[name], name))
+        self.busted.extend(out)
+        self.tables = rebalance([[name for name in seats if name not in out] for seats in self.tables], self.table_size)
+
+    def standings(self):
+        """ Names from first place to last: players still in by money, then the rest by when they went out."""
+        remaining = sorted((name for seats in self.tables for name in seats), key=lambda name: (-self.money[name], name))
+        return remaining + self.busted[::-1]
+
+def run(tournaments: list[Tournament], processes=None, ratings=None, on_finish=None):
+    """ Play all the tournaments to the end over one process pool.
+
+    Args:
+        tournaments: Tournaments to play; they can be at any round
+        processes: number of worker processes, by default one per core
+        ratings: optional Ratings to update as each table's result comes in
+        on_finish: optional function called with each tournament as it ends
+    """
+    with ProcessPoolExecutor(processes) as pool:
+        running = {}
+
+        def start_round(tournament):
+            if tournament.finished:
+                if on_finish is not None:
+                    on_finish(tournament)
+                return
+            for task in tournament.table_tasks():
+                running[pool.submit(_play_table, *task)] = tournament
+                tournament.pending += 1
+
+        for tournament in tournaments:
+            start_round(tournament)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                tournament = running.pop(future)
+                before, after = future.result()
+                tournament.record(after)
+                if ratings is not None:
+                    ratings.update(before, after)
+                tournament.pending -= 1
+                if tournament.pending == 0:
+                    tournament.finish_round()
+                    start_round(tournament)
+    return tournaments
+
+class League:
+    """ The same entrants over num_tournaments tournaments, with points for finishing places and Elo ratings.
+
+    A tournament of n entrants gives n - 1 points for first place down to none for last.
+    """
+    def __init__(self, entrants, num_tournaments, seed=0, **tournament_options):
+        self.entrants = list(entrants)
+        self.num_tournaments = num_tournaments
+        self.seed = seed
+        self.tournament_options = tournament_options
+        self.ratings = Ratings()
+        self.results = {name: {'points': 0, 'wins': 0, 'finishes': []} for name, _ in self.entrants}
+
+    def record(self, tournament):
+        for place, name in enumerate(tournament.standings()):
+            self.results[name]['points'] += len(self.entrants) - 1 - place
+            self.results[name]['wins'] += place == 0
+            self.results[name]['finishes'].append(place + 1)
+
+    def run(self, processes=None):
+        seeds = spawn_seeds(self.seed, self.num_tournaments)
+        tournaments = [Tournament(self.entrants, seed=seed, **self.tournament_options) for seed in seeds]
+        run(tournaments, processes, self.ratings, self.record)
+        return self.standings()
+
+    def standings(self):
+        """ One row per entrant, most points first."""
+        rows = [{'name': name, 'points': result['points'], 'wins': result['wins'],
+                 'mean_finish': float(np.mean(result['finishes'])) if result['finishes'] else None,
+                 'rating': self.ratings[name]} for name, result in self.results.items()]
+        return sorted(rows, key=lambda row: (-row['points'], row['name']))
+
+
+def test_rebalance():
+    assert rebalance([['a', 'b', 'c'], ['d'], ['e', 'f', 'g']], 6) == [['a', 'b', 'c', 'd'], ['e', 'f', 'g']]
+    tables = rebalance([list('abcdef'), ['g'], list('hijklm')], 6)
+    assert sorted(map(len, tables)) == [4, 4, 5]
+    assert sorted(name for seats in tables for name in seats) == list('abcdefghijklm')
+    assert sorted(map(len, rebalance([list('abcdefghij'), list('kl')], 6))) == [6, 6]
+    assert rebalance([['a'], [], []], 6) == [['a']]
+
+def test_tournament():
+    entrants = [('Louis', AutomaticPlayer)] + [(f"Bot {i}", RandomPlayer) for i in range(1, 12)]
+    tournament = Tournament(entrants, table_size=5, hands_per_round=5, max_rounds=30, seed=1)
+    assert sorted(map(len, tournament.tables)) == [4, 4, 4]
+    run([tournament], processes=2)
+    standings = tournament.standings()
+    assert sorted(standings) == sorted(name for name, _ in entrants)
+    assert abs(sum(tournament.money.values()) - 1200) < 1e-6 # money only changes hands
+    assert tournament.finished and all(len(seats) <= 5 for seats in tournament.tables)
+    again = Tournament(entrants, table_size=5, hands_per_round=5, max_rounds=30, seed=1)
+    run([again], processes=1)
+    assert again.standings() == standings and again.money == tournament.money
+
+def test_league():
+    entrants = [('Louis', AutomaticPlayer), ('Bot 1', RandomPlayer), ('Bot 2', RandomPlayer), ('Bot 3', RandomPlayer)]
+    league = League(entrants, 4, seed=2, table_size=2, hands_per_round=5, max_rounds=10)
+    standings = league.run(processes=2)
+    assert sum(row['points'] for row in standings) == 4 * (3 + 2 + 1)
+    assert sum(row['wins'] for row in standings) == 4
+    assert abs(sum(row['rating'] for row in standings) - 4 * 1500) < 1e-6 # Elo only moves points between players
+
+if __name__ == "__main__":
+    entrants = [('Louis', AutomaticPlayer)] + [(f"Bot {i}", RandomPlayer) for i in range(1, 18)]
+    league = League(entrants, 20, table_size=6, hands_per_round=10)
+    for row in league.run():
+        print(f"{row['name']:8} {row['points']:5} points {row['wins']:3} wins  "
+              f"mean finish {row['mean_finish']:5.2f}  rating {row['rating']:7.1f}")